@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'unicollab.profiling.ProfilingMiddleware',
+    'unicollab.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,8 +89,48 @@ DATABASES = {
         'OPTIONS': {
             'charset': 'utf8mb4',
         },
+        # keep connections open between requests, re-checking them before reuse
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# Read replicas are extra aliases in DATABASES listed in UNICOLLAB_READ_REPLICAS
+# below; they need the same CONN_MAX_AGE/CONN_HEALTH_CHECKS settings.
+DATABASE_ROUTERS = ['unicollab.routers.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# `auth` holds the token -> user cache, membership sets and replica pins, and
+# `responses` the cached list responses and their generation keys. Both are
+# file based by default, so an invalidation in one worker process reaches
+# every worker on the host without any other service running. Set
+# UNICOLLAB_REDIS_URL (e.g. redis://127.0.0.1:6379) to keep them in Redis
+# databases 1 and 2 instead, shared across hosts and bounded by maxmemory.
+UNICOLLAB_REDIS_URL = os.environ.get('UNICOLLAB_REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{UNICOLLAB_REDIS_URL}/1',
+    } if UNICOLLAB_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'auth',
+        # the default of 300 would cull live tokens on any busy site
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{UNICOLLAB_REDIS_URL}/2',
+    } if UNICOLLAB_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 import sys
 
 if 'test' in sys.argv:
@@ -95,7 +138,29 @@ if 'test' in sys.argv:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': ':memory:',
-        }
+        },
+        # stand-ins for read replicas, see ReplicaRoutingTests
+        'replica1': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+            'TEST': {'MIRROR': 'default'},
+        },
+        'replica2': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    CACHES['auth'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+    CACHES['responses'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
     }
 
 # Password validation
@@ -116,6 +181,10 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+AUTHENTICATION_BACKENDS = [
+    'unicollab.backends.UsernameOrEmailBackend',
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -134,6 +203,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded resource files (content-addressed blobs, see unicollab.files)
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = 'media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -146,10 +219,79 @@ REST_FRAMEWORK = {
         
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'unicollab.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'unicollab.profiling.ProfiledJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    'DEFAULT_PAGINATION_CLASS': 'unicollab.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
+# upper bound for the ?page_size= query parameter
+UNICOLLAB_MAX_PAGE_SIZE = 200
+# largest list accepted by /tasks/bulk/
+UNICOLLAB_BULK_MAX_ITEMS = 1000
+# most change-log entries returned by one /sync/ call
+UNICOLLAB_SYNC_BATCH = 500
+# age (seconds) a change-log entry must reach before /sync/ cursors move past
+# it, longer than any write transaction runs, and the age (days) past which
+# manage.py prune_change_log drops entries
+UNICOLLAB_SYNC_LAG = 5
+UNICOLLAB_SYNC_RETENTION_DAYS = 30
+# rows fetched per query by /projects/<id>/export/
+UNICOLLAB_EXPORT_CHUNK_SIZE = 1000
+# age (days) past which manage.py archive_messages moves messages to the
+# archive, and how many it moves per transaction
+UNICOLLAB_MESSAGE_ARCHIVE_DAYS = 90
+UNICOLLAB_ARCHIVE_BATCH_SIZE = 1000
+# manage.py send_reminders: how many days ahead a due date earns a reminder,
+# and how many tasks it reads per query
+UNICOLLAB_REMINDER_DAYS = 1
+UNICOLLAB_REMINDER_CHUNK_SIZE = 5000
+# storage alias holding uploaded resource files and the largest upload accepted (bytes)
+UNICOLLAB_RESOURCE_STORAGE = 'default'
+UNICOLLAB_MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+# cache alias and lifetime (seconds) of authenticated token lookups
+UNICOLLAB_AUTH_CACHE = 'auth'
+UNICOLLAB_TOKEN_CACHE_TTL = 300
+# lifetime (seconds) of the cached per-user project membership sets, also kept
+# in the auth cache
+UNICOLLAB_MEMBERSHIP_CACHE_TTL = 300
+# cache alias and lifetime (seconds) of ETag-cached list responses
+UNICOLLAB_RESPONSE_CACHE = 'responses'
+UNICOLLAB_RESPONSE_CACHE_TTL = 300
+# rows per list on /projects/<id>/dashboard/ and how long (seconds) a cached
+# dashboard may be served
+UNICOLLAB_DASHBOARD_ITEMS = 10
+UNICOLLAB_DASHBOARD_CACHE_TTL = 30
+# fraction of requests profiled (0 disables), and how many executions of the
+# same SQL in one request are reported as a likely N+1
+UNICOLLAB_PROFILING_SAMPLE_RATE = 0.0
+UNICOLLAB_PROFILING_N_PLUS_ONE = 5
+
+# aliases that receive safe-method viewset reads, how long (seconds) a user
+# reads from default after a write, and how long a failing replica is skipped
+UNICOLLAB_READ_REPLICAS = []
+UNICOLLAB_REPLICA_PIN_SECONDS = 5
+UNICOLLAB_REPLICA_RETRY_SECONDS = 30
+
+# fan-out backend for /projects/<id>/stream/ and the seconds between keepalive comments
+UNICOLLAB_MESSAGE_HUB = 'unicollab.streaming.InProcessHub'
+UNICOLLAB_STREAM_HEARTBEAT = 15
+# seconds before a resumed stream's Last-Event-ID message that are replayed too,
+# to cover messages that committed after a message with a higher id
+UNICOLLAB_STREAM_REPLAY_GRACE = 5
+
+# turns project events into notifications off the request path; the worker
+# coalesces events arriving within LINGER seconds, up to BATCH per insert
+UNICOLLAB_NOTIFICATION_PIPELINE = 'unicollab.fanout.SyncPipeline' if 'test' in sys.argv else 'unicollab.fanout.ThreadedPipeline'
+UNICOLLAB_NOTIFICATION_BATCH = 500
+UNICOLLAB_NOTIFICATION_LINGER = 0.05
+# seconds the worker gets at exit to deliver the events still queued
+UNICOLLAB_NOTIFICATION_SHUTDOWN_TIMEOUT = 5
+
 AUTH_USER_MODEL = 'unicollab.User'
\ No newline at end of file
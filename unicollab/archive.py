@@ -0,0 +1,128 @@
+"""
+Two-tier message history.
+
+`manage.py archive_messages` moves messages older than
+`UNICOLLAB_MESSAGE_ARCHIVE_DAYS` out of the live `Message` table into
+`ArchivedMessage`, oldest first, one batch per transaction, so a run can be
+stopped at any point and the next one carries on where it left off. Archived
+rows keep their id and store their text zlib-compressed when that is smaller.
+The live table, and the indexes every chat read goes through, then only hold
+recent history.
+
+Because the oldest messages always go first, the archive holds a prefix of
+the `(timestamp, id)` order. `GET /projects/<id>/history/` pages newest first
+across both tiers with one keyset cursor: a page the live table fills on its
+own never touches the archive, and older pages merge the two range scans.
+
+Archived messages are read-only. They are dropped from the search index and
+are not part of /sync/ or the project export, which only see the live table.
+Moving a message is not deleting it: the Message post_delete receivers check
+`is_archiving()` and leave the search index, dashboards and sync feed to the
+batch, which updates them once per batch and writes no sync tombstones.
+"""
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import bump, project_dashboard_key
+from .models import Message, ArchivedMessage, SearchDocument
+from .pagination import KeysetPagination
+from .serializers import MessageSerializer, values_mapper
+from .visibility import visible_messages, visible_archived_messages
+
+RAW, DEFLATED = b'\x00', b'\x01'
+
+_archiving = ContextVar('unicollab_archiving', default=False)
+
+
+@contextmanager
+def archiving():
+    """Mark the Message deletes inside the block as moves to the archive."""
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def is_archiving():
+    return _archiving.get()
+
+
+def pack(text):
+    raw = text.encode('utf-8')
+    deflated = zlib.compress(raw, 9)
+    return DEFLATED + deflated if len(deflated) < len(raw) else RAW + raw
+
+
+def unpack(data):
+    data = bytes(data)
+    body = zlib.decompress(data[1:]) if data[:1] == DEFLATED else data[1:]
+    return body.decode('utf-8')
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'UNICOLLAB_MESSAGE_ARCHIVE_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to `batch_size` of the oldest messages sent before `cutoff`;
+    returns how many were moved."""
+    with transaction.atomic():
+        rows = list(
+            Message.objects.select_for_update().filter(timestamp__lt=cutoff).order_by('timestamp', 'id')
+            .values_list('id', 'sender_id', 'project_id', 'timestamp', 'content')[:batch_size]
+        )
+        if not rows:
+            return 0
+        ArchivedMessage.objects.bulk_create([
+            ArchivedMessage(id=pk, sender_id=sender_id, project_id=project_id, timestamp=timestamp, content=pack(content))
+            for pk, sender_id, project_id, timestamp, content in rows
+        ], ignore_conflicts=True)
+        ids = [row[0] for row in rows]
+        SearchDocument.objects.filter(kind='message', object_id__in=ids).delete()
+        with archiving():
+            Message.objects.filter(id__in=ids).delete()
+        bump(*(project_dashboard_key(project_id) for project_id in {row[2] for row in rows}))
+    return len(rows)
+
+
+def archive_messages(cutoff, batch_size=None, max_batches=None):
+    """Archive every message sent before `cutoff`, or stop after `max_batches`
+    batches; returns how many were moved."""
+    batch_size = batch_size or getattr(settings, 'UNICOLLAB_ARCHIVE_BATCH_SIZE', 1000)
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        batches += 1
+        if moved < batch_size:
+            break
+    return total
+
+
+class HistoryPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+def message_history(paginator, request, project_id):
+    """One page of the project's messages visible to the requester, rendered
+    like the /messages/ list, from the live table and then the archive."""
+    user = request.user
+    mapper = values_mapper(MessageSerializer)
+    live, position = paginator.start_page(mapper.values(visible_messages(user).filter(project_id=project_id)), request, None)
+    rows = list(live)
+    if paginator.reverse or len(rows) <= paginator.page_size_value:
+        archived = paginator.get_page_queryset(
+            mapper.values(visible_archived_messages(user).filter(project_id=project_id)), position,
+        )
+        rows += [{**row, 'content': unpack(row['content'])} for row in archived]
+        rows.sort(key=lambda row: (row['timestamp'], row['id']), reverse=not paginator.reverse)
+    return mapper.render(paginator.build_page(rows[:paginator.page_size_value + 1], position))
@@ -0,0 +1,88 @@
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def get_auth_cache():
+    return caches[getattr(settings, 'UNICOLLAB_AUTH_CACHE', 'default')]
+
+
+def token_cache_key(key):
+    return 'auth:token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def invalidate_tokens(*keys):
+    get_auth_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+@lru_cache(maxsize=None)
+def cached_user_fields():
+    """Every stored User column but the password hash, which never leaves the database."""
+    return tuple(field.attname for field in get_user_model()._meta.concrete_fields if field.attname != 'password')
+
+
+def dump_user(user):
+    return tuple(getattr(user, name) for name in cached_user_fields())
+
+
+def load_user(values):
+    # the password is a deferred field: reading it loads it, and save() leaves it alone
+    return get_user_model().from_db(DEFAULT_DB_ALIAS, cached_user_fields(), values)
+
+
+def _token_ttl():
+    return getattr(settings, 'UNICOLLAB_TOKEN_CACHE_TTL', 300)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication with the Token -> User lookup cached for
+    `UNICOLLAB_TOKEN_CACHE_TTL` seconds. The cache holds the user's columns
+    without the password hash. Entries are dropped when the token is deleted
+    (logout) or its user is saved, see `unicollab.signals`.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_auth_cache()
+        cache_key = token_cache_key(key)
+        values = cache.get(cache_key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, dump_user(user), _token_ttl())
+            # a logout between the lookup and the set would leave the deleted
+            # token cached; its own invalidation may already have run
+            if not Token.objects.filter(key=key).exists():
+                cache.delete(cache_key)
+            return user, token
+        user = load_user(values)
+        return user, Token(key=key, user=user)
+
+
+async def aauthenticate_token(request):
+    """Async counterpart of CachedTokenAuthentication for plain Django async views.
+    Returns the active user for an `Authorization: Token <key>` header or None."""
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    cache = get_auth_cache()
+    cache_key = token_cache_key(auth[1])
+    values = await cache.aget(cache_key)
+    if values is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=auth[1])
+        except Token.DoesNotExist:
+            return None
+        user = token.user
+        if not user.is_active:
+            return None
+        await cache.aset(cache_key, dump_user(user), _token_ttl())
+        if not await Token.objects.filter(key=auth[1]).aexists():
+            await cache.adelete(cache_key)
+        return user
+    return load_user(values)
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Case, IntegerField, Q, Value, When
+
+
+class UsernameOrEmailBackend(ModelBackend):
+    """
+    Log in with either the username or the email address.
+
+    The user is resolved with a single query over the username and email
+    indexes, and the password is hashed exactly once whether or not a user
+    matched, keeping ModelBackend's timing-attack mitigation without paying
+    for it twice.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        by_username = Q(**{UserModel.USERNAME_FIELD: username})
+        candidates = list(
+            UserModel._default_manager
+            .filter(by_username | Q(**{UserModel.get_email_field_name(): username}))
+            .order_by(Case(When(by_username, then=Value(0)), default=Value(1), output_field=IntegerField()))[:2]
+        )
+        user = None
+        if candidates and (getattr(candidates[0], UserModel.USERNAME_FIELD) == username or len(candidates) == 1):
+            user = candidates[0]
+
+        if user is None:
+            # no match, or an email shared by several accounts
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
@@ -0,0 +1,660 @@
+"""
+Seeded performance scenarios, run with `python manage.py benchmark <scenario>`.
+
+Every scenario runs inside a throwaway test database so it never touches real
+data; the seed is deterministic for a given set of scale options.
+"""
+import asyncio
+import math
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLResolver, resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import urls
+from .authentication import CachedTokenAuthentication
+from .models import User, Project, Task, Resource, Message, Notification, NotificationCounter, Schedule, TaskStatusCount
+from .reminders import send_reminders
+from .search import rebuild_index
+from .serializers import TaskSerializer, MessageSerializer, ResourceSerializer, values_mapper
+from .visibility import member_project_ids, visible_projects, visible_tasks, visible_resources, visible_messages
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+SCALE_OPTIONS = ('users', 'projects', 'members', 'tasks', 'messages', 'resources', 'schedules', 'notifications')
+
+
+def seed(users=200, projects=50, members=10, tasks=20, messages=50, resources=5, schedules=5, notifications=10, random_seed=0):
+    """Create `users` users and `projects` projects of roughly `members` members
+    each; tasks, messages, resources and schedules are per project,
+    notifications per user. Returns the user ids in creation order."""
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com', password='!') for i in range(users)
+    )
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+
+    Project.objects.bulk_create(
+        Project(title=f'project{i}', description='seeded', created_by_id=rng.choice(user_ids), is_public=i % 2 == 0)
+        for i in range(projects)
+    )
+    project_rows = list(Project.objects.order_by('id').values_list('id', 'created_by_id'))
+    membership, project_members = [], {}
+    for project_id, creator_id in project_rows:
+        chosen = {creator_id, *rng.sample(user_ids, min(members, len(user_ids)))}
+        project_members[project_id] = sorted(chosen)
+        membership += [Project.members.through(project_id=project_id, user_id=user_id) for user_id in chosen]
+    Project.members.through.objects.bulk_create(membership, batch_size=2000)
+
+    Task.objects.bulk_create((
+        Task(
+            title=f'task{project_id}-{i}', description='seeded task', priority=rng.choice(['low', 'medium', 'high']),
+            status=rng.choice(['to_do', 'in_progress', 'done']), assigned_to_id=rng.choice(project_members[project_id]),
+            due_date=date.today() + timedelta(days=rng.randint(0, 60)), is_public=rng.random() < 0.3, project_id=project_id,
+        )
+        for project_id, _ in project_rows for i in range(tasks)
+    ), batch_size=2000)
+    TaskStatusCount.objects.rebuild()
+    Message.objects.bulk_create((
+        Message(sender_id=rng.choice(project_members[project_id]), content=f'message {i}', project_id=project_id)
+        for project_id, _ in project_rows for i in range(messages)
+    ), batch_size=2000)
+    Resource.objects.bulk_create((
+        Resource(
+            title=f'resource{project_id}-{i}', file_url='https://example.com/file', uploaded_by_id=rng.choice(project_members[project_id]),
+            is_public=rng.random() < 0.5, project_id=project_id,
+        )
+        for project_id, _ in project_rows for i in range(resources)
+    ), batch_size=2000)
+    Schedule.objects.bulk_create((
+        Schedule(
+            title=f'schedule{project_id}-{i}', start_time=(start := now + timedelta(hours=rng.randint(0, 24 * 14))),
+            end_time=start + timedelta(minutes=rng.choice([30, 60, 90])), scheduled_by_id=rng.choice(project_members[project_id]),
+            project_id=project_id, is_team_event=rng.random() < 0.5,
+        )
+        for project_id, _ in project_rows for i in range(schedules)
+    ), batch_size=2000)
+    Notification.objects.bulk_create((
+        Notification(user_id=user_id, content=f'notification {i}', type=rng.choice(['reminder', 'update', 'mention', 'message']))
+        for user_id in user_ids for i in range(notifications)
+    ), batch_size=2000)
+    NotificationCounter.objects.adjust({user_id: notifications for user_id in user_ids})
+    rebuild_index()
+    return user_ids
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def visibility_scenario(out, options):
+    seed(**{key: options[key] for key in SCALE_OPTIONS})
+    user = User.objects.order_by('id').first()
+    legacy = {
+        'projects': lambda u: Project.objects.filter(members=u) | Project.objects.filter(created_by=u),
+        'tasks': lambda u: Task.objects.filter(assigned_to=u) | Task.objects.filter(is_public=True),
+        'resources': lambda u: Resource.objects.filter(is_public=True) | Resource.objects.filter(uploaded_by=u),
+        'messages': lambda u: Message.objects.filter(project__members=u) | Message.objects.filter(sender=u),
+    }
+    current = {
+        'projects': visible_projects,
+        'tasks': visible_tasks,
+        'resources': visible_resources,
+        'messages': visible_messages,
+    }
+    for name in legacy:
+        out.write(f'== {name} ==')
+        for label, queryset in (('legacy OR-union', legacy[name](user)), ('visibility', current[name](user))):
+            ids, ms = timed(lambda: list(queryset.values_list('id', flat=True)), options['repeat'])
+            out.write(f'-- {label}: {len(ids)} rows ({len(set(ids))} distinct), median {ms:.2f} ms')
+            out.write(str(queryset.values('id').query))
+            out.write(queryset.values('id').explain())
+
+
+def login_scenario(out, options):
+    from django.contrib.auth.backends import ModelBackend
+    from django.contrib.auth.hashers import make_password
+    from .backends import UsernameOrEmailBackend
+
+    password = 'correct horse battery staple'
+    hashed = make_password(password)
+    User.objects.bulk_create(
+        User(username=f'login{i}', email=f'login{i}@example.com', password=hashed) for i in range(options['logins'])
+    )
+    users = list(User.objects.order_by('id'))
+
+    def legacy(identifier):
+        # the old LoginView: authenticate as username, then look up by email and authenticate again
+        backend = ModelBackend()
+        user = backend.authenticate(None, username=identifier, password=password)
+        if user is None:
+            try:
+                user = backend.authenticate(None, username=User.objects.get(email=identifier).username, password=password)
+            except User.DoesNotExist:
+                pass
+        return user
+
+    backend = UsernameOrEmailBackend()
+    flows = (('legacy', legacy), ('backend', lambda identifier: backend.authenticate(None, username=identifier, password=password)))
+    for label, flow in flows:
+        for field in ('username', 'email'):
+            start = time.perf_counter()
+            for user in users:
+                assert flow(getattr(user, field)) is not None
+            elapsed = time.perf_counter() - start
+            out.write(f'{label:8} by {field:8} {len(users) / elapsed:8.1f} logins/s')
+
+
+def serializers_scenario(out, options):
+    seed(**{key: options[key] for key in SCALE_OPTIONS})
+    renderer = JSONRenderer()
+    for label, serializer_class, ordering in (
+        ('tasks', TaskSerializer, ('due_date', 'id')),
+        ('messages', MessageSerializer, ('timestamp', 'id')),
+        ('resources', ResourceSerializer, ('-timestamp', '-id')),
+    ):
+        model = serializer_class.Meta.model
+        mapper = values_mapper(serializer_class)
+        select = {lookup.split('__')[0] for lookup in mapper.lookups if '__' in lookup}
+        flows = (
+            ('serializer', lambda: renderer.render(serializer_class(model.objects.select_related(*select).order_by(*ordering), many=True).data)),
+            ('values', lambda: renderer.render(mapper.render(mapper.values(model.objects.order_by(*ordering))))),
+        )
+        results = {}
+        rows = model.objects.count()
+        for name, flow in flows:
+            results[name], ms = timed(flow, options['repeat'])
+            out.write(f'{label:10} {name:10} {rows} rows, median {ms:.1f} ms, {rows / ms * 1000:10.0f} rows/s')
+        if results['serializer'] != results['values']:
+            raise CommandError(f'{label}: values() rendering differs from the serializer')
+
+
+def reminders_scenario(out, options):
+    seed(**{key: options[key] for key in SCALE_OPTIONS})
+    tasks = Task.objects.count()
+    for label in ('first run', 'second run'):
+        start = time.perf_counter()
+        created = send_reminders(days=60)
+        elapsed = time.perf_counter() - start
+        out.write(f'{label:10} {tasks} tasks, {created} reminders created in {elapsed:.2f} s, {tasks / elapsed:10.0f} tasks/s')
+    if created:
+        raise CommandError('send_reminders is not idempotent')
+
+
+# Most SQL queries one request to each endpoint may issue. The numbers must not
+# depend on the seeded scale; raising one needs a reason in the commit message.
+QUERY_BUDGETS = {
+    'api-root': 0,
+    'register': 5,
+    'login': 5,
+    'users-list': 7,
+    'users-detail': 7,
+    'users-me': 7,
+    'projects-list': 2,
+    'projects-create': 7,
+    'projects-detail': 2,
+    'projects-update': 5,
+    'projects-partial-update': 5,
+    'projects-destroy': 14,
+    'projects-members': 9,
+    'projects-members-add': 7,
+    'projects-members-remove': 6,
+    'projects-export': 5,
+    'projects-dashboard': 6,
+    'projects-board': 3,
+    'projects-history': 3,
+    'tasks-list': 1,
+    'tasks-create': 13,
+    'tasks-detail': 1,
+    'tasks-update': 7,
+    'tasks-partial-update': 5,
+    'tasks-destroy': 8,
+    'tasks-bulk': 10,
+    'tasks-bulk-update': 4,
+    'tasks-assign': 6,
+    'schedules-list': 1,
+    'schedules-create': 4,
+    'schedules-detail': 3,
+    'schedules-update': 5,
+    'schedules-partial-update': 5,
+    'schedules-destroy': 3,
+    'schedules-calendar': 1,
+    'schedules-busy': 1,
+    'schedules-conflicts': 1,
+    'resources-list': 1,
+    'resources-create': 7,
+    'resources-detail': 1,
+    'resources-update': 6,
+    'resources-partial-update': 4,
+    'resources-destroy': 6,
+    'resources-upload': 10,
+    'resources-download': 1,
+    'notifications-list': 1,
+    'notifications-create': 4,
+    'notifications-detail': 1,
+    'notifications-update': 3,
+    'notifications-partial-update': 3,
+    'notifications-destroy': 5,
+    'notifications-unread-count': 1,
+    'notifications-read': 8,
+    'notifications-mark-all-read': 5,
+    'messages-list': 1,
+    'messages-create': 12,
+    'messages-detail': 1,
+    'messages-update': 9,
+    'messages-partial-update': 4,
+    'messages-destroy': 6,
+    'search': 4,
+    'sync': 9,
+    'metrics': 0,
+    'async-messages-list': 1,
+    'async-notifications-list': 1,
+    'async-tasks-list': 1,
+    'async-users-me': 7,
+    'logout': 3,
+}
+
+
+def load_endpoints(user):
+    """(name, method, url, payload) for every route and method in
+    unicollab/urls.py except the never-ending message stream, with ids picked
+    from rows `user` can see. A callable `url` is called before each request
+    and returns (url, payload), for requests that use something up: a row to
+    delete, a username to register, the token logout deletes."""
+    project = Project.objects.filter(members=user).order_by('id').first()
+    task = visible_tasks(user).order_by('id').first()
+    schedule = Schedule.objects.filter(scheduled_by=user).order_by('id').first() or Schedule.objects.create(
+        title='own', start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1), scheduled_by=user, project=project,
+    )
+    resource = Resource.objects.filter(is_public=True).order_by('id').first()
+    notification = Notification.objects.filter(user=user).order_by('id').first()
+    message = Message.objects.filter(project=project).order_by('id').first()
+    window = f'start={timezone.now().date().isoformat()}T00:00:00Z&end={(timezone.now() + timedelta(days=7)).date().isoformat()}T00:00:00Z'
+    token = Token.objects.get(user=user).key
+    password = 'load-Password-1'
+    User.objects.create_user('load-login', password=password)
+    other = User.objects.exclude(pk=user.pk).order_by('id').first()
+    owned = Project.objects.create(title='load-owned', description='load test', created_by=user)
+    own_resource = Resource.objects.create(
+        title='load', file_url='https://example.com/load', project=project, uploaded_by=user,
+    )
+    own_task = Task.objects.create(
+        title='load', description='load test', status='to_do', priority='low', due_date=date.today(),
+        assigned_to=user, project=project,
+    )
+    serial = iter(range(1, 10 ** 9))
+
+    task_fields = {
+        'title': 'load', 'description': 'load test', 'status': 'to_do', 'priority': 'low', 'due_date': str(date.today()),
+        'project': project.title, 'assigned_to': user.username,
+    }
+    schedule_fields = {
+        'title': 'load', 'start_time': timezone.now().isoformat(), 'end_time': (timezone.now() + timedelta(hours=1)).isoformat(),
+        'project': project.title, 'scheduled_by': user.username, 'is_team_event': False,
+    }
+    resource_fields = {'title': 'load', 'file_url': 'https://example.com/load', 'project': project.title, 'uploaded_by': user.username}
+    notification_fields = {'content': 'load test', 'type': 'update'}
+    message_fields = {'content': 'load test', 'project': project.pk}
+
+    def register():
+        username = f'load-{next(serial)}'
+        return '/register/', {'username': username, 'email': f'{username}@example.com', 'password': password, 'password2': password}
+
+    def upload():
+        content = f'load test {next(serial)}'.encode()
+        return '/resources/upload/', {'title': 'load', 'project': project.title, 'file': SimpleUploadedFile('load.txt', content)}
+
+    def download():
+        uploaded = Resource.objects.filter(uploaded_by=user).exclude(file='').latest('id')
+        return f'/resources/{uploaded.pk}/download/', None
+
+    def scratch(prefix, model, **fields):
+        return lambda: (f'{prefix}{model.objects.create(**fields).pk}/', None)
+
+    def logout():
+        # the previous iteration deleted the token the client sends
+        Token.objects.get_or_create(key=token, user=user)
+        return '/logout/', None
+
+    return [
+        ('api-root', 'get', '/', None),
+        ('register', 'post', register, None),
+        ('login', 'post', '/login/', {'username': 'load-login', 'password': password}),
+        ('users-list', 'get', '/users/', None),
+        ('users-detail', 'get', f'/users/{user.pk}/', None),
+        ('users-me', 'get', '/users/me/', None),
+        ('projects-list', 'get', '/projects/', None),
+        ('projects-create', 'post', lambda: ('/projects/', {'title': f'load-{next(serial)}', 'description': 'load test'}), None),
+        ('projects-detail', 'get', f'/projects/{project.pk}/', None),
+        ('projects-update', 'put', f'/projects/{owned.pk}/', {'title': 'load-owned', 'description': 'load test', 'is_public': True}),
+        ('projects-partial-update', 'patch', f'/projects/{owned.pk}/', {'description': 'load test'}),
+        ('projects-destroy', 'delete', scratch('/projects/', Project, title='load-scratch', description='load test', created_by=user), None),
+        ('projects-members', 'get', f'/projects/{project.pk}/members/', None),
+        ('projects-members-add', 'post', f'/projects/{owned.pk}/members/', {'users': [other.pk]}),
+        ('projects-members-remove', 'delete', f'/projects/{owned.pk}/members/', {'users': [other.pk]}),
+        ('projects-export', 'get', f'/projects/{project.pk}/export/', None),
+        ('projects-dashboard', 'get', f'/projects/{project.pk}/dashboard/', None),
+        ('projects-board', 'get', f'/projects/{project.pk}/board/', None),
+        ('projects-history', 'get', f'/projects/{project.pk}/history/', None),
+        ('tasks-list', 'get', '/tasks/', None),
+        ('tasks-create', 'post', '/tasks/', task_fields),
+        ('tasks-detail', 'get', f'/tasks/{task.pk}/', None),
+        ('tasks-update', 'put', f'/tasks/{own_task.pk}/', task_fields),
+        ('tasks-partial-update', 'patch', f'/tasks/{own_task.pk}/', {'priority': 'medium'}),
+        ('tasks-destroy', 'delete', scratch('/tasks/', Task, **{
+            **task_fields, 'project': project, 'assigned_to': user, 'due_date': date.today(),
+        }), None),
+        ('tasks-bulk', 'post', '/tasks/bulk/', [task_fields]),
+        ('tasks-bulk-update', 'patch', '/tasks/bulk/', [{'id': own_task.pk, 'priority': 'high'}]),
+        ('tasks-assign', 'post', f'/tasks/{own_task.pk}/assign/', {'user_id': user.pk}),
+        ('schedules-list', 'get', '/schedules/', None),
+        ('schedules-create', 'post', '/schedules/', schedule_fields),
+        ('schedules-detail', 'get', f'/schedules/{schedule.pk}/', None),
+        ('schedules-update', 'put', f'/schedules/{schedule.pk}/', schedule_fields),
+        ('schedules-partial-update', 'patch', f'/schedules/{schedule.pk}/', {'title': 'load'}),
+        ('schedules-destroy', 'delete', scratch('/schedules/', Schedule, **{
+            **schedule_fields, 'project': project, 'scheduled_by': user,
+            'start_time': timezone.now(), 'end_time': timezone.now() + timedelta(hours=1),
+        }), None),
+        ('schedules-calendar', 'get', f'/schedules/calendar/?{window}', None),
+        ('schedules-busy', 'get', f'/schedules/busy/?{window}', None),
+        ('schedules-conflicts', 'get', f'/schedules/conflicts/?{window}&project={project.pk}', None),
+        ('resources-list', 'get', '/resources/', None),
+        ('resources-create', 'post', '/resources/', resource_fields),
+        ('resources-detail', 'get', f'/resources/{resource.pk}/', None),
+        ('resources-update', 'put', f'/resources/{own_resource.pk}/', resource_fields),
+        ('resources-partial-update', 'patch', f'/resources/{own_resource.pk}/', {'is_public': True}),
+        ('resources-destroy', 'delete', scratch('/resources/', Resource, **{
+            **resource_fields, 'project': project, 'uploaded_by': user,
+        }), None),
+        ('resources-upload', 'post', upload, None),
+        ('resources-download', 'get', download, None),
+        ('notifications-list', 'get', '/notifications/', None),
+        ('notifications-create', 'post', '/notifications/', notification_fields),
+        ('notifications-detail', 'get', f'/notifications/{notification.pk}/', None),
+        ('notifications-update', 'put', f'/notifications/{notification.pk}/', notification_fields),
+        ('notifications-partial-update', 'patch', f'/notifications/{notification.pk}/', {'type': 'update'}),
+        ('notifications-destroy', 'delete', scratch('/notifications/', Notification, **notification_fields, user=user), None),
+        ('notifications-unread-count', 'get', '/notifications/unread_count/', None),
+        ('notifications-read', 'post', f'/notifications/{notification.pk}/read/', None),
+        ('notifications-mark-all-read', 'post', '/notifications/mark_all_read/', None),
+        ('messages-list', 'get', '/messages/', None),
+        ('messages-create', 'post', '/messages/', message_fields),
+        ('messages-detail', 'get', f'/messages/{message.pk}/', None),
+        ('messages-update', 'put', f'/messages/{message.pk}/', message_fields),
+        ('messages-partial-update', 'patch', f'/messages/{message.pk}/', {'content': 'load test'}),
+        ('messages-destroy', 'delete', scratch('/messages/', Message, content='load test', project=project, sender=user), None),
+        ('search', 'get', '/search/?q=seeded+task', None),
+        ('sync', 'get', '/sync/?since=0', None),
+        ('metrics', 'get', '/metrics/', None),
+        ('async-messages-list', 'get', '/async/messages/', None),
+        ('async-notifications-list', 'get', '/async/notifications/', None),
+        ('async-tasks-list', 'get', '/async/tasks/', None),
+        ('async-users-me', 'get', '/async/users/me/', None),
+        # last: it deletes the token every other request authenticates with
+        ('logout', 'post', logout, None),
+    ]
+
+
+def route_methods(patterns=None):
+    """{(url name, HTTP method)} for every route in unicollab/urls.py, the
+    load test's coverage target."""
+    routes = set()
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            routes |= route_methods(pattern.url_patterns)
+            continue
+        view = pattern.callback
+        if hasattr(view, 'actions'):  # viewset routes
+            methods = [method for method in view.actions if method != 'head']
+        elif hasattr(view, 'view_class'):
+            methods = [method for method in view.view_class.http_method_names if method not in ('head', 'options') and hasattr(view.view_class, method)]
+        else:  # the plain function views are all require_GET
+            methods = ['get']
+        routes |= {(pattern.name, method.upper()) for method in methods}
+    return routes
+
+
+# not in the load test: the SSE stream only ends when the client goes away
+UNLOADED_ROUTES = {('project-stream', 'GET')}
+
+
+def count_queries(captured):
+    # transaction control: savepoints only appear inside an outer transaction
+    # (tests), BEGIN and COMMIT only outside one and only on backends that
+    # issue them as SQL (SQLite)
+    return sum(1 for query in captured if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK', 'BEGIN', 'COMMIT')))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_load(user, iterations=10, client_class=APIClient):
+    """Hit every endpoint `iterations` times as `user` and return
+    {name: {'p50', 'p95', 'p99', 'queries', 'status', 'failed', 'route'}};
+    latencies in ms, `queries` the most any single request issued and `route`
+    the (url name, method) it exercised. Uploads go to a temporary MEDIA_ROOT."""
+    client = client_class()
+    token = Token.objects.get_or_create(user=user)[0].key
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+    results = {}
+    with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+        for name, method, url, payload in load_endpoints(user):
+            samples, queries, statuses, failed = [], 0, Counter(), False
+            for _ in range(iterations):
+                path, data = url() if callable(url) else (url, payload)
+                # the token and membership set live in the auth cache, which
+                # the writes before may have dropped; `user` memoizes its set
+                CachedTokenAuthentication().authenticate_credentials(token)
+                member_project_ids(User(pk=user.pk))
+                # measure the uncached path; response caches would hide regressions
+                for cache in caches.all():
+                    if cache is not caches[getattr(settings, 'UNICOLLAB_AUTH_CACHE', 'default')]:
+                        cache.clear()
+                multipart = isinstance(data, dict) and any(isinstance(value, File) for value in data.values())
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(path, data, format='multipart' if multipart else 'json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    samples.append((time.perf_counter() - start) * 1000)
+                response.close()
+                queries = max(queries, count_queries(ctx.captured_queries))
+                statuses[response.status_code] += 1
+                failed = failed or response.status_code >= 400
+            results[name] = {
+                'p50': percentile(samples, 50), 'p95': percentile(samples, 95), 'p99': percentile(samples, 99),
+                'queries': queries, 'status': ','.join(str(code) for code in sorted(statuses)), 'failed': failed,
+                'route': (resolve(urlsplit(path).path).url_name, method.upper()),
+            }
+    return results
+
+
+def over_budget(results):
+    return {
+        name: (result['queries'], QUERY_BUDGETS.get(name, 0))
+        for name, result in results.items() if result['queries'] > QUERY_BUDGETS.get(name, 0)
+    }
+
+
+def load_scenario(out, options):
+    user_ids = seed(**{key: options[key] for key in SCALE_OPTIONS})
+    user = User.objects.get(pk=user_ids[0])
+    user.is_staff = True
+    user.save()
+    results = run_load(user, options['repeat'])
+    out.write(f'{"endpoint":28} {"status":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"budget":>7}')
+    for name, result in results.items():
+        out.write(
+            f'{name:28} {result["status"]:>7} {result["p50"]:8.2f} {result["p95"]:8.2f} {result["p99"]:8.2f} '
+            f'{result["queries"]:8d} {QUERY_BUDGETS.get(name, 0):7d}'
+        )
+    failed = [name for name, result in results.items() if result['failed']]
+    if failed:
+        raise CommandError('Endpoints failed: ' + ', '.join(failed))
+    exceeded = over_budget(results)
+    if exceeded:
+        raise CommandError('Query budget exceeded: ' + ', '.join(
+            f'{name} ({queries} > {budget})' for name, (queries, budget) in exceeded.items()
+        ))
+
+
+# the hot read endpoints, as DRF viewsets and as native async views
+SYNC_READ_PATHS = ('/messages/', '/notifications/', '/tasks/', '/users/me/')
+ASYNC_READ_PATHS = tuple('/async' + path for path in SYNC_READ_PATHS)
+
+
+@contextmanager
+def wsgi_server():
+    """Django's threaded development WSGI server on a free local port."""
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class Server(ThreadedWSGIServer):
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = Server(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@contextmanager
+def asgi_server():
+    """uvicorn serving config.asgi's application on a free local port."""
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    server = uvicorn.Server(uvicorn.Config(
+        get_asgi_application(), host='127.0.0.1', port=0, lifespan='off', log_level='warning', backlog=2048,
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise CommandError('uvicorn failed to start')
+        time.sleep(0.01)
+    try:
+        yield server.servers[0].sockets[0].getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+async def fetch(port, path, token):
+    """Status code of one GET over a fresh HTTP/1.1 connection. The Host is
+    `testserver`, the only one ALLOWED_HOSTS accepts inside throwaway_database."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write((
+            f'GET {path} HTTP/1.1\r\nHost: testserver\r\nAuthorization: Token {token}\r\nConnection: close\r\n\r\n'
+        ).encode('ascii'))
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+    return int(status_line.split()[1])
+
+
+async def drive(port, paths, token, clients, requests_per_client):
+    """Run `clients` concurrent clients, each issuing `requests_per_client`
+    sequential GETs cycling through `paths`; returns (latencies ms, errors, seconds)."""
+    latencies, errors = [], 0
+
+    async def client(offset):
+        nonlocal errors
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, paths[(offset + i) % len(paths)], token)
+            except OSError:
+                status = None
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += status != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def concurrency_scenario(out, options):
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError:
+        raise CommandError('The concurrency scenario serves ASGI with uvicorn: pip install uvicorn')
+    user_ids = seed(**{key: options[key] for key in SCALE_OPTIONS})
+    token = Token.objects.get_or_create(user_id=user_ids[0])[0].key
+    modes = (
+        ('wsgi', wsgi_server, SYNC_READ_PATHS),
+        ('asgi sync views', asgi_server, SYNC_READ_PATHS),
+        ('asgi async views', asgi_server, ASYNC_READ_PATHS),
+    )
+    out.write(f'{options["clients"]} concurrent clients x {options["repeat"]} requests over {", ".join(SYNC_READ_PATHS)}')
+    out.write(f'{"mode":18} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for label, server, paths in modes:
+        with server() as port:
+            asyncio.run(drive(port, paths, token, 1, len(paths)))  # warm caches and connections
+            latencies, errors, elapsed = asyncio.run(drive(port, paths, token, options['clients'], options['repeat']))
+        out.write(
+            f'{label:18} {len(latencies) / elapsed:8.1f} {percentile(latencies, 50):8.1f} '
+            f'{percentile(latencies, 95):8.1f} {percentile(latencies, 99):8.1f} {errors:7d}'
+        )
+
+
+SCENARIOS = {
+    'visibility': visibility_scenario,
+    'login': login_scenario,
+    'load': load_scenario,
+    'serializers': serializers_scenario,
+    'concurrency': concurrency_scenario,
+    'reminders': reminders_scenario,
+}
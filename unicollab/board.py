@@ -0,0 +1,63 @@
+"""
+Kanban board behind `GET /projects/<id>/board/`.
+
+The columns come from one query over the visible tasks of the project ordered
+by (status, due_date, id), which the `task_board_idx` (project, status,
+due_date) index returns pre-sorted. The column headers read the materialized
+TaskStatusCount rows instead of counting the task table.
+
+Saves move a task's count from the key it is stored under to its new one. The
+old key is read from the row under a lock in the saving transaction, never
+taken from when the instance was loaded: a concurrent save may have moved the
+task since.
+"""
+from collections import Counter
+
+from .models import Task, TaskStatusCount
+from .serializers import TaskSerializer, values_mapper
+from .visibility import visible_tasks
+
+
+# Task fields that make up its TaskStatusCount key
+BOARD_FIELDS = frozenset(['project', 'project_id', 'status', 'is_public', 'assigned_to', 'assigned_to_id'])
+
+
+def saves_board_key(update_fields):
+    return update_fields is None or bool(BOARD_FIELDS.intersection(update_fields))
+
+
+def lock_stored_keys(task_ids):
+    """{task id: (board key, sync audience)} as the tasks are stored now,
+    locking their rows until the end of the transaction."""
+    rows = Task.objects.select_for_update().filter(pk__in=task_ids).values_list('id', 'project_id', 'status', 'is_public', 'assigned_to_id')
+    return {
+        pk: ((project_id, status, 0 if is_public else assigned_to_id), (project_id, assigned_to_id, is_public))
+        for pk, project_id, status, is_public, assigned_to_id in rows
+    }
+
+
+def count_moves(moves):
+    """{key: delta} for TaskStatusCount.objects.adjust from (old key, new key)
+    pairs; None stands for a task that did not exist before or no longer does."""
+    deltas = Counter()
+    for old, new in moves:
+        if old == new:
+            continue
+        if old is not None:
+            deltas[old] -= 1
+        if new is not None:
+            deltas[new] += 1
+    return deltas
+
+
+def task_board(user, project_id):
+    mapper = values_mapper(TaskSerializer)
+    rows = mapper.values(visible_tasks(user).filter(project_id=project_id).order_by('status', 'due_date', 'id'))
+    columns = {status: [] for status, _ in Task.STATUS_CHOICES}
+    for task in mapper.render(rows):
+        columns.setdefault(task['status'], []).append(task)
+    counts = dict.fromkeys(columns, 0)
+    visible_counts = TaskStatusCount.objects.filter(project_id=project_id, private_to__in=[0, user.pk])
+    for status, count in visible_counts.values_list('status', 'count'):
+        counts[status] = counts.get(status, 0) + count
+    return {'counts': counts, 'columns': columns}
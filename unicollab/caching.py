@@ -0,0 +1,136 @@
+"""
+Per-view response caching with ETag support.
+
+Cached entries embed the current value of one or more *generation* keys. The
+signals in `unicollab.signals` drop a generation key whenever rows it covers
+change, so every entry built on the old generation becomes unreachable at once
+without having to know which users or query strings were cached.
+"""
+import hashlib
+import json
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .visibility import projects_of
+
+RESOURCES = 'gen:resources'
+
+
+def project_members_key(project_id):
+    return f'gen:project:{project_id}:members'
+
+
+def project_dashboard_key(project_id):
+    return f'gen:project:{project_id}:dashboard'
+
+
+def get_response_cache():
+    return caches[getattr(settings, 'UNICOLLAB_RESPONSE_CACHE', 'default')]
+
+
+def current_generations(keys):
+    cache = get_response_cache()
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return tuple(found[key] for key in keys)
+
+
+# generation keys and member-list users waiting for the current transaction to
+# commit; see bump()
+_pending = threading.local()
+
+
+def _pending_batch():
+    batch = getattr(_pending, 'batch', None)
+    if batch is None:
+        batch = _pending.batch = (set(), set())
+    return batch
+
+
+def _flush():
+    keys, user_ids = _pending_batch()
+    if not keys and not user_ids:
+        return
+    _pending.batch = None
+    keys |= {project_members_key(project_id) for project_id in projects_of(user_ids)}
+    get_response_cache().delete_many(list(keys))
+
+
+def _defer(keys=(), user_ids=()):
+    keys, user_ids = set(keys), {user_id for user_id in user_ids if user_id is not None}
+    if not keys and not user_ids:
+        return
+    batch = _pending_batch()
+    batch[0].update(keys)
+    batch[1].update(user_ids)
+    # Every call registers a callback, so a batch survives a rolled-back
+    # savepoint; the first callback to run after commit flushes everything
+    # collected and the rest find nothing to do. Keys from rolled-back work
+    # are flushed with the next batch, which only costs a cache miss.
+    transaction.on_commit(_flush)
+
+
+def bump(*keys):
+    """Drop generation keys once the current transaction commits (at once in
+    autocommit), so a concurrent reader cannot re-cache the old rows under the
+    new generation. All bumps of a transaction go out in one delete_many."""
+    _defer(keys=keys)
+
+
+def bump_member_lists(*user_ids):
+    """Invalidate /projects/<id>/members/ for every project these users belong
+    to, on commit like bump()."""
+    _defer(user_ids=user_ids)
+
+
+def visibility_scope(request):
+    return f'user:{request.user.pk}' if request.user.is_authenticated else 'anon'
+
+
+def cached_response(depends_on, scope=visibility_scope, timeout_setting='UNICOLLAB_RESPONSE_CACHE_TTL'):
+    """
+    Cache a viewset method's 200 responses per (scope, query params, url kwargs)
+    and answer matching If-None-Match requests with 304. `depends_on(view,
+    request, **kwargs)` returns the generation keys the response is built from;
+    entries live for the number of seconds in the `timeout_setting` setting.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = get_response_cache()
+            generations = current_generations(depends_on(self, request, **kwargs))
+            identity = repr((
+                type(self).__name__, method.__name__, scope(request),
+                sorted(request.query_params.lists()), sorted(kwargs.items()), generations,
+            ))
+            cache_key = 'response:' + hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+            response, entry = None, cache.get(cache_key)
+            if entry is None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                body = json.dumps(response.data, cls=JSONEncoder, separators=(',', ':'))
+                entry = ('"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest(), response.data)
+                cache.set(cache_key, entry, getattr(settings, timeout_setting, 300))
+
+            etag, data = entry
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            response = response or Response(data)
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+"""
+Project dashboard behind `GET /projects/<id>/dashboard/`.
+
+Everything the dashboard shows comes from a fixed number of queries whatever
+the project's size: one conditional-Count aggregate over the visible tasks
+for the status, priority and overdue counts, and one bounded, index-ordered
+values() query each for the overdue tasks, the latest messages and resources
+and the upcoming schedules.
+"""
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Task
+from .serializers import TaskSerializer, MessageSerializer, ResourceSerializer, ScheduleSerializer, values_mapper
+from .visibility import visible_tasks, visible_resources, visible_messages, visible_schedules
+
+
+def task_counts(tasks, today):
+    aggregates = {
+        'total': Count('pk'),
+        'overdue': Count('pk', filter=Q(due_date__lt=today) & ~Q(status='done')),
+    }
+    for value, _ in Task.STATUS_CHOICES:
+        aggregates[f'status_{value}'] = Count('pk', filter=Q(status=value))
+    for value, _ in Task.PRIORITY_CHOICES:
+        aggregates[f'priority_{value}'] = Count('pk', filter=Q(priority=value))
+    row = tasks.aggregate(**aggregates)
+    return {
+        'total': row['total'],
+        'overdue': row['overdue'],
+        'by_status': {value: row[f'status_{value}'] for value, _ in Task.STATUS_CHOICES},
+        'by_priority': {value: row[f'priority_{value}'] for value, _ in Task.PRIORITY_CHOICES},
+    }
+
+
+def latest(serializer_class, queryset, limit):
+    mapper = values_mapper(serializer_class)
+    return mapper.render(mapper.values(queryset)[:limit])
+
+
+def project_dashboard(user, project_id, limit=None):
+    limit = limit or getattr(settings, 'UNICOLLAB_DASHBOARD_ITEMS', 10)
+    now = timezone.now()
+    today = timezone.localdate(now)
+    tasks = visible_tasks(user).filter(project_id=project_id)
+    return {
+        'tasks': task_counts(tasks, today),
+        'overdue_tasks': latest(
+            TaskSerializer, tasks.filter(due_date__lt=today).exclude(status='done').order_by('due_date', 'id'), limit,
+        ),
+        'messages': latest(
+            MessageSerializer, visible_messages(user).filter(project_id=project_id).order_by('-timestamp', '-id'), limit,
+        ),
+        'resources': latest(
+            ResourceSerializer, visible_resources(user).filter(project_id=project_id).order_by('-timestamp', '-id'), limit,
+        ),
+        'schedules': latest(
+            ScheduleSerializer,
+            visible_schedules(user).filter(project_id=project_id, end_time__gt=now).order_by('start_time', 'id'), limit,
+        ),
+    }
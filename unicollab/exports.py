@@ -0,0 +1,102 @@
+"""
+Streaming project exports.
+
+Rows are read with values_list() in id-ordered keyset chunks of
+UNICOLLAB_EXPORT_CHUNK_SIZE, one query per chunk, and encoded as they arrive,
+so memory stays flat however large the project is. Plain `.iterator()` is not
+enough on MySQL, whose driver buffers the whole result set client-side.
+
+Under ASGI a sync streaming body is consumed in one thread hop and buffered
+whole, so the view wraps the export in `aiterate`, which pulls one chunk per
+`sync_to_async` call instead.
+"""
+import csv
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .visibility import visible_tasks, visible_resources, visible_messages, visible_schedules
+
+# (type, visibility rule, ((column, lookup), ...)); `id` must come first
+EXPORTS = (
+    ('task', visible_tasks, (
+        ('id', 'id'), ('title', 'title'), ('description', 'description'), ('priority', 'priority'),
+        ('status', 'status'), ('due_date', 'due_date'), ('is_public', 'is_public'),
+        ('assigned_to', 'assigned_to__username'),
+    )),
+    ('message', visible_messages, (
+        ('id', 'id'), ('sender', 'sender__username'), ('content', 'content'), ('timestamp', 'timestamp'),
+    )),
+    ('resource', visible_resources, (
+        ('id', 'id'), ('title', 'title'), ('file_url', 'file_url'), ('is_public', 'is_public'),
+        ('uploaded_by', 'uploaded_by__username'), ('timestamp', 'timestamp'),
+    )),
+    ('schedule', visible_schedules, (
+        ('id', 'id'), ('title', 'title'), ('start_time', 'start_time'), ('end_time', 'end_time'),
+        ('is_team_event', 'is_team_event'), ('scheduled_by', 'scheduled_by__username'),
+    )),
+)
+CSV_COLUMNS = ['type', *dict.fromkeys(column for _, _, fields in EXPORTS for column, _ in fields)]
+
+
+def export_chunks(user, project_id, chunk_size=None):
+    """Yield (type, columns, rows) with at most `chunk_size` rows each."""
+    chunk_size = chunk_size or getattr(settings, 'UNICOLLAB_EXPORT_CHUNK_SIZE', 1000)
+    for kind, rule, fields in EXPORTS:
+        columns = [column for column, _ in fields]
+        queryset = rule(user).filter(project_id=project_id).order_by('id').values_list(*(lookup for _, lookup in fields))
+        last_id = None
+        while True:
+            rows = list((queryset if last_id is None else queryset.filter(id__gt=last_id))[:chunk_size])
+            if rows:
+                yield kind, columns, rows
+            if len(rows) < chunk_size:
+                break
+            last_id = rows[-1][0]
+
+
+def ndjson_export(user, project):
+    encoder = JSONEncoder(ensure_ascii=False)
+    yield encoder.encode({'type': 'project', 'id': project.pk, 'title': project.title, 'description': project.description}) + '\n'
+    for kind, columns, rows in export_chunks(user, project.pk):
+        yield ''.join(encoder.encode({'type': kind, **dict(zip(columns, row))}) + '\n' for row in rows)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def csv_export(user, project):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for kind, columns, rows in export_chunks(user, project.pk):
+        positions = [CSV_COLUMNS.index(column) for column in columns]
+        chunk = []
+        for row in rows:
+            line = [''] * len(CSV_COLUMNS)
+            line[0] = kind
+            for position, value in zip(positions, row):
+                line[position] = csv_value(value)
+            chunk.append(writer.writerow(line))
+        yield ''.join(chunk)
+
+
+async def aiterate(iterator):
+    """Async iterator over a sync one, advancing it one item per
+    sync_to_async call on the thread the ORM runs on."""
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while (item := await step(iterator, done)) is not done:
+        yield item
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_export, 'application/x-ndjson'),
+    'csv': (csv_export, 'text/csv'),
+}
@@ -0,0 +1,193 @@
+"""
+Notifications for project events, created off the request path.
+
+Signals (and the bulk task endpoint) `submit` an `Event` once the write has
+committed. The pipeline configured by `UNICOLLAB_NOTIFICATION_PIPELINE` turns
+events into Notification rows: `ThreadedPipeline` queues them for a background
+worker that coalesces whatever arrived within `UNICOLLAB_NOTIFICATION_LINGER`
+seconds (up to `UNICOLLAB_NOTIFICATION_BATCH` events) into one membership
+query and one bulk insert, so API writes cost the same however many members a
+project has. A batch that fails is retried one event at a time, so only the
+events that fail on their own are dropped. `SyncPipeline` delivers inline and
+is what the tests use.
+
+At exit the worker gets up to `UNICOLLAB_NOTIFICATION_SHUTDOWN_TIMEOUT` seconds
+to deliver what is still queued; a process that is killed loses it.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from .caching import bump_member_lists
+from .models import Project, Notification, NotificationCounter, bulk_create_with_pks
+from .sync import record_changes
+
+logger = logging.getLogger(__name__)
+
+# `recipients` is a list of user ids, or None for every project member; the
+# actor is never notified of their own event
+Event = namedtuple('Event', ['type', 'project_id', 'actor_id', 'content', 'recipients'])
+
+_actor = ContextVar('unicollab_actor', default=None)
+
+
+@contextmanager
+def acting_as(user_id):
+    """Make `user_id` the actor of the events signal handlers build inside the
+    block; they cannot see the request themselves."""
+    token = _actor.set(user_id)
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+def current_actor():
+    return _actor.get()
+
+
+def deliver(events):
+    """Create the notifications for a batch of events; returns them."""
+    project_ids = {event.project_id for event in events if event.recipients is None}
+    members = {}
+    if project_ids:
+        memberships = Project.members.through.objects.filter(project_id__in=project_ids).values_list('project_id', 'user_id')
+        for project_id, user_id in memberships:
+            members.setdefault(project_id, []).append(user_id)
+
+    return create_notifications([
+        Notification(user_id=user_id, type=event.type, content=event.content)
+        for event in events
+        for user_id in (members.get(event.project_id, ()) if event.recipients is None else event.recipients)
+        if user_id != event.actor_id
+    ])
+
+
+def create_notifications(notifications):
+    """Bulk insert unsaved notifications and do what their save() signals would:
+    bump the unread counters, log the sync changes, drop the cached lists."""
+    if notifications:
+        with transaction.atomic():
+            # the change log needs the ids, which MySQL does not return
+            bulk_create_with_pks(Notification, notifications, key=('user', 'type', 'task', 'content'))
+            NotificationCounter.objects.adjust(Counter(notification.user_id for notification in notifications))
+            record_changes(notifications)
+        # bulk writes bypass the model signals
+        bump_member_lists(*{notification.user_id for notification in notifications})
+    return notifications
+
+
+class BasePipeline(ABC):
+    @abstractmethod
+    def submit(self, event):
+        """Deliver `event` now or later."""
+
+    def flush(self, timeout=None):
+        """Block until every submitted event has been delivered, or `timeout`
+        seconds have passed; returns whether everything was delivered."""
+        return True
+
+
+class SyncPipeline(BasePipeline):
+    def submit(self, event):
+        deliver([event])
+
+
+class ThreadedPipeline(BasePipeline):
+    def __init__(self):
+        self.batch_size = getattr(settings, 'UNICOLLAB_NOTIFICATION_BATCH', 500)
+        self.linger = getattr(settings, 'UNICOLLAB_NOTIFICATION_LINGER', 0.05)
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        atexit.register(self.shutdown)
+
+    def submit(self, event):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='unicollab-notifications', daemon=True)
+                    self._worker.start()
+        self.queue.put(event)
+
+    def flush(self, timeout=None):
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def shutdown(self):
+        timeout = getattr(settings, 'UNICOLLAB_NOTIFICATION_SHUTDOWN_TIMEOUT', 5)
+        if not self.flush(timeout):
+            logger.error('Exiting with %d notification events undelivered', self.queue.unfinished_tasks)
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def deliver(self, batch):
+        try:
+            deliver(batch)
+        except Exception:
+            if len(batch) == 1:
+                logger.exception('Dropped notification event %r', batch[0])
+                return
+            logger.warning('Delivering %d notification events failed, retrying one by one', len(batch), exc_info=True)
+            for event in batch:
+                self.deliver([event])
+
+    def _run(self):
+        while True:
+            batch = self.next_batch()
+            close_old_connections()
+            try:
+                self.deliver(batch)
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+@lru_cache(maxsize=None)
+def get_pipeline():
+    return import_string(getattr(settings, 'UNICOLLAB_NOTIFICATION_PIPELINE', 'unicollab.fanout.ThreadedPipeline'))()
+
+
+def submit_on_commit(*events):
+    def submit():
+        pipeline = get_pipeline()
+        for event in events:
+            pipeline.submit(event)
+
+    if events:
+        transaction.on_commit(submit)
+
+
+def message_event(message):
+    return Event('message', message.project_id, message.sender_id, f'New message: {message.content[:200]}', None)
+
+
+def assignment_event(task, actor_id):
+    return Event('update', task.project_id, actor_id, f'You were assigned "{task.title}" due {task.due_date}', [task.assigned_to_id])
+
+
+def team_event(schedule):
+    return Event(
+        'reminder', schedule.project_id, schedule.scheduled_by_id,
+        f'"{schedule.title}" is scheduled for {schedule.start_time:%Y-%m-%d %H:%M %Z}', None,
+    )
@@ -0,0 +1,178 @@
+"""
+Resource file storage behind `POST /resources/upload/` and
+`GET /resources/<id>/download/`.
+
+Uploads are streamed by `HashingUploadHandler` into a temporary file chunk by
+chunk, hashing as they go, so the worker never holds more than one chunk.
+Blobs are content-addressed: stored once under their SHA-256 in the
+`UNICOLLAB_RESOURCE_STORAGE` storage and shared by every resource with the
+same content. FileSystemStorage moves the temporary file into place instead
+of copying it. Each blob has a ResourceBlob row, locked by the upload that
+points a new resource at it and by the cleanup that deletes it once the last
+resource is gone, so a blob is never deleted under an upload still being
+committed.
+
+Downloads are FileResponses over the open blob. Under a WSGI server with
+`wsgi.file_wrapper` (gunicorn, uWSGI) the body is sent with sendfile(); a
+Range request seeks the file to the first byte and caps the length, which the
+file wrapper honours, so partial content stays zero-copy as well. The ASGI
+handler would read a sync file iterator to the end before sending anything,
+so under ASGI the body is an async iterator that reads one block per
+`sync_to_async` call instead.
+"""
+import hashlib
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import storages
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.db import transaction
+from django.http import FileResponse, HttpResponse
+
+from .models import Resource, ResourceBlob
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# bytes read per thread hop when streaming a download under ASGI
+ASYNC_BLOCK_SIZE = 64 * 1024
+
+
+def get_resource_storage():
+    return storages[getattr(settings, 'UNICOLLAB_RESOURCE_STORAGE', 'default')]
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Writes every uploaded file to a temporary file and records its SHA-256 as
+    `file.sha256`. Files over UNICOLLAB_MAX_UPLOAD_SIZE are dropped mid-stream
+    and flagged with `too_large`."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.too_large = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > getattr(settings, 'UNICOLLAB_MAX_UPLOAD_SIZE', 100 * 1024 * 1024):
+            self.too_large = True
+            raise SkipFile()
+        self.digest.update(raw_data)
+        super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
+
+
+def blob_name(sha256):
+    return f'resources/{sha256[:2]}/{sha256}'
+
+
+def store(uploaded):
+    """Storage name of the blob holding `uploaded`, saving it unless it is
+    already stored. Must run in the transaction that saves the resource: the
+    blob stays locked against `release` until the resource is committed."""
+    storage = get_resource_storage()
+    blob, _ = ResourceBlob.objects.select_for_update().get_or_create(
+        sha256=uploaded.sha256, defaults={'name': blob_name(uploaded.sha256)},
+    )
+    # the name is the content's hash, so a file already under it (left by a
+    # cleanup that did not finish) holds the same bytes; saving over it would
+    # make the storage pick a suffixed name instead
+    if not storage.exists(blob.name):
+        storage.save(blob.name, uploaded)
+    return blob.name
+
+
+def release(name, sha256):
+    """Delete a blob once no resource refers to it any more."""
+    if not name:
+        return
+    with transaction.atomic():
+        blob = ResourceBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if Resource.objects.filter(sha256=sha256, file=name).exists():
+            return
+        get_resource_storage().delete(name)
+        if blob is not None:
+            blob.delete()
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single `bytes=` range, None to send the whole
+    file, or False when the range cannot be satisfied."""
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+class FileRange:
+    """File-like view of `length` bytes of an open file from its current
+    position. Exposes fileno() so WSGI file wrappers can still sendfile() it."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+async def aread_blocks(file, block_size=ASYNC_BLOCK_SIZE):
+    # plain file reads: no need to queue behind the thread that runs the ORM
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while block := await read(block_size):
+        yield block
+
+
+def file_response(resource, range_header=None, asynchronous=False):
+    """The download response for `resource`, its body an async iterator when
+    `asynchronous` (under ASGI)."""
+    size = resource.size
+    byte_range = parse_range(range_header, size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = get_resource_storage().open(resource.file.name, 'rb')
+    content_type = resource.content_type or 'application/octet-stream'
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, as_attachment=True, filename=resource.title)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            FileRange(file, end - start + 1), status=206, content_type=content_type,
+            as_attachment=True, filename=resource.title,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if asynchronous:
+        # the file is still closed with the response
+        response.streaming_content = aread_blocks(response.file_to_stream)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = f'"{resource.sha256}"'
+    return response
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from unicollab.archive import archive_cutoff, archive_messages
+
+
+class Command(BaseCommand):
+    help = 'Move messages older than --days from the live table into the message archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='defaults to UNICOLLAB_MESSAGE_ARCHIVE_DAYS')
+        parser.add_argument('--batch-size', type=int, default=None, help='defaults to UNICOLLAB_ARCHIVE_BATCH_SIZE')
+        parser.add_argument('--max-batches', type=int, default=None, help='stop after this many batches')
+
+    def handle(self, *args, **options):
+        moved = archive_messages(archive_cutoff(options['days']), options['batch_size'], options['max_batches'])
+        self.stdout.write(f'{moved} messages archived')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from unicollab.benchmarks import SCENARIOS, throwaway_database
+
+
+class Command(BaseCommand):
+    help = 'Run a seeded performance scenario against a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--projects', type=int, default=50)
+        parser.add_argument('--members', type=int, default=10)
+        parser.add_argument('--tasks', type=int, default=20, help='tasks per project')
+        parser.add_argument('--messages', type=int, default=50, help='messages per project')
+        parser.add_argument('--resources', type=int, default=5, help='resources per project')
+        parser.add_argument('--schedules', type=int, default=5, help='schedules per project')
+        parser.add_argument('--notifications', type=int, default=10, help='notifications per user')
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--clients', type=int, default=1000, help='concurrent clients (concurrency scenario)')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_database(verbosity=options['verbosity'] - 1):
+            SCENARIOS[options['scenario']](self.stdout, options)
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from unicollab.sync import prune_change_log
+
+
+class Command(BaseCommand):
+    help = 'Delete /sync/ change-log entries older than --days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='defaults to UNICOLLAB_SYNC_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, default=10000, help='entries deleted per transaction')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'UNICOLLAB_SYNC_RETENTION_DAYS', 30)
+        deleted = prune_change_log(timezone.now() - timedelta(days=days), options['batch_size'])
+        self.stdout.write(f'{deleted} change-log entries deleted')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from unicollab.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from every message, task and resource.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        counts = rebuild_index(options['batch_size'])
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count} indexed')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from unicollab.reminders import send_reminders
+
+
+class Command(BaseCommand):
+    help = 'Notify assignees of the unfinished tasks due within the next --days days. Safe to run repeatedly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='defaults to UNICOLLAB_REMINDER_DAYS')
+        parser.add_argument('--chunk-size', type=int, default=None, help='defaults to UNICOLLAB_REMINDER_CHUNK_SIZE')
+
+    def handle(self, *args, **options):
+        created = send_reminders(days=options['days'], chunk_size=options['chunk_size'])
+        self.stdout.write(f'{created} reminders created')
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0005_notification_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['project', 'start_time', 'end_time'], name='schedule_project_range_idx'),
+        ),
+    ]
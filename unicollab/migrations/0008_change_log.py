@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('project', 'Project'), ('task', 'Task'), ('message', 'Message'), ('resource', 'Resource'), ('schedule', 'Schedule'), ('notification', 'Notification')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('project_id', models.PositiveIntegerField(null=True)),
+                ('user_id', models.PositiveIntegerField(null=True)),
+                ('is_public', models.BooleanField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'id'], name='changelog_user_idx'), models.Index(fields=['project_id', 'id'], name='changelog_project_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0008_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='content_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='file',
+            field=models.FileField(blank=True, editable=False, max_length=200, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Value, When
+
+
+def backfill_counts(apps, schema_editor):
+    Task = apps.get_model('unicollab', 'Task')
+    TaskStatusCount = apps.get_model('unicollab', 'TaskStatusCount')
+    rows = Task.objects.annotate(
+        private_to=Case(When(is_public=True, then=Value(0)), default=F('assigned_to_id'), output_field=models.PositiveIntegerField()),
+    ).values('project_id', 'status', 'private_to').annotate(total=Count('id')).order_by()
+    TaskStatusCount.objects.bulk_create(
+        (TaskStatusCount(project_id=row['project_id'], status=row['status'], private_to=row['private_to'], count=row['total']) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0009_resource_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('to_do', 'To_do'), ('in_progress', 'In_progress'), ('done', 'Done')], max_length=100)),
+                ('private_to', models.PositiveIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'status', 'due_date'], name='task_board_idx'),
+        ),
+        migrations.AddField(
+            model_name='taskstatuscount',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_status_counts', to='unicollab.project'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskstatuscount',
+            constraint=models.UniqueConstraint(fields=('project', 'status', 'private_to'), name='taskstatuscount_key_uniq'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
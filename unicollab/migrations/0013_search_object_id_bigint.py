@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0012_task_reminders'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchdocument',
+            name='object_id',
+            field=models.BigIntegerField(),
+        ),
+    ]
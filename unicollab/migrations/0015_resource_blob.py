@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:56
+
+from django.db import migrations, models
+
+
+def backfill_blobs(apps, schema_editor):
+    Resource = apps.get_model('unicollab', 'Resource')
+    ResourceBlob = apps.get_model('unicollab', 'ResourceBlob')
+    rows = Resource.objects.exclude(file='').values_list('sha256', 'file').distinct().order_by()
+    ResourceBlob.objects.bulk_create(
+        (ResourceBlob(sha256=sha256, name=name) for sha256, name in rows.iterator()),
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0014_change_log_bigint_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+            ],
+        ),
+        migrations.RunPython(backfill_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicollab', '0015_resource_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskstatuscount',
+            name='private_to',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
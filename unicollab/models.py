@@ -1,10 +1,66 @@
-from django.db import models
+from django.db import DatabaseError, connections, models, router, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 # Create your models here.
 class User(AbstractUser):
-    pass
+    email = models.EmailField(_("email address"), blank=True, db_index=True)
 
-class Project(models.Model):
+
+def bulk_create_with_pks(model, objs, key, batch_size=500):
+    """bulk_create `objs` and leave every one of them with its pk. Backends
+    that cannot return ids from a bulk INSERT (MySQL) get them by reading back
+    the rows above the highest id committed before the insert, in id order,
+    and matching them to `objs` in order on the `key` fields. Rows another
+    transaction committed in between are skipped as long as their key differs;
+    one that matches is an identical row, and either id will do."""
+    objs = list(objs)
+    using = router.db_for_write(model)
+    if not objs or connections[using].features.can_return_rows_from_bulk_insert:
+        return model.objects.using(using).bulk_create(objs, batch_size=batch_size)
+    attnames = [model._meta.get_field(field).attname for field in key]
+    with transaction.atomic(using=using):
+        floor = model.objects.using(using).order_by('-pk').values_list('pk', flat=True).first() or 0
+        model.objects.using(using).bulk_create(objs, batch_size=batch_size)
+        rows = model.objects.using(using).filter(
+            pk__gt=floor, **{f'{attnames[0]}__in': {getattr(obj, attnames[0]) for obj in objs}},
+        ).order_by('pk').values_list('pk', *attnames)
+        pending = iter(objs)
+        obj = next(pending)
+        for pk, *values in rows.iterator():
+            if values == [getattr(obj, attname) for attname in attnames]:
+                obj.pk = pk
+                obj = next(pending, None)
+                if obj is None:
+                    return objs
+        raise DatabaseError(f'could not read back the ids of the new {model._meta.object_name} rows')
+
+
+class SyncedModel(models.Model):
+    """A model in the /sync/ change feed, see unicollab.sync. `sync_audience`
+    names the attributes holding a row's project, owning user and public flag,
+    None where there is no such column. Rows remember the audience they were
+    loaded with, so an update can tombstone it without reading the row again."""
+    sync_audience = (None, None, None)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(attname is None or attname in field_names for attname in cls.sync_audience):
+            instance._loaded_audience = instance.audience()
+        return instance
+
+    def audience(self):
+        return tuple(getattr(self, attname) if attname else None for attname in self.sync_audience)
+
+
+class Project(SyncedModel):
+    sync_audience = ('id', 'created_by_id', None)
     title = models.CharField(max_length= 200)
     description = models.TextField()
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_projects', db_index=True)
@@ -14,7 +70,8 @@ class Project(models.Model):
     def __str__(self):
         return f"Project {self.title} created_by {self.created_by.username}"
     
-class Task(models.Model):
+class Task(SyncedModel):
+    sync_audience = ('project_id', 'assigned_to_id', 'is_public')
     title = models.CharField(max_length= 200)
     description = models.TextField()
     PRIORITY_CHOICES = [
@@ -34,11 +91,37 @@ class Task(models.Model):
     is_public = models.BooleanField(default=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='project_tasks', db_index=True )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_public', 'id'], name='task_public_id_idx'),
+            models.Index(fields=['project', 'status', 'due_date'], name='task_board_idx'),
+        ]
+
     def __str__(self):
         return f" Task {self.title} created under Project {self.project_id.title} "
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'assigned_to_id' in field_names:
+            instance._loaded_assigned_to_id = instance.assigned_to_id
+        if {'project_id', 'status', 'is_public', 'assigned_to_id'}.issubset(field_names):
+            instance._loaded_board_key = TaskStatusCount.key_for(instance)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # the board signals lock the row and move its status count in here
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
     
-class Resource(models.Model):
+class Resource(SyncedModel):
+    sync_audience = ('project_id', 'uploaded_by_id', 'is_public')
     file_url = models.URLField(editable=False, max_length=500)
+    # an uploaded file's content-addressed blob, see unicollab.files
+    file = models.FileField(max_length=200, blank=True, editable=False)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    size = models.PositiveBigIntegerField(null=True, editable=False)
+    content_type = models.CharField(max_length=100, blank=True, editable=False)
     title  = models.CharField(max_length=200)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_files')
     is_public = models.BooleanField(default=True, db_index=True)
@@ -48,16 +131,46 @@ class Resource(models.Model):
     def __str__(self):
         return f" Resource: {self.title} has been uploaded by {self.uploaded_by.username} on {self.timestamp}"
     
-class Message(models.Model):
+class ResourceBlob(models.Model):
+    """A stored blob, see unicollab.files. Its row is locked while a resource
+    is pointed at the blob or the blob is deleted, so the two never overlap."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=200)
+
+
+class Message(SyncedModel):
+    sync_audience = ('project_id', 'sender_id', None)
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages_sent', db_index=True)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='project_messages', db_index=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'timestamp'], name='message_project_ts_idx'),
+        ]
+
     def __str__(self):
         return f"message by {self.sender.username}"
-    
-class Notification(models.Model):
+
+
+class ArchivedMessage(models.Model):
+    """A Message moved out of the live table by `manage.py archive_messages`.
+    Keeps the message's id, and its text as `unicollab.archive.pack` bytes."""
+    id = models.BigIntegerField(primary_key=True)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_messages', db_index=True)
+    content = models.BinaryField()
+    timestamp = models.DateTimeField()
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='archived_messages', db_index=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'timestamp'], name='archivedmessage_project_ts_idx'),
+        ]
+
+
+class Notification(SyncedModel):
+    sync_audience = (None, 'user_id', None)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_notifications', db_index=True)
     content = models.TextField()
     NOTIFICATION_TYPE_CHOICES = [
@@ -67,12 +180,126 @@ class Notification(models.Model):
         ('message', 'Message')
     ]
     type = models.CharField(max_length=200, choices=NOTIFICATION_TYPE_CHOICES, db_index=True)
-    is_read = models.BooleanField(default=True)
+    is_read = models.BooleanField(default=False)
+    # set on deadline reminders only: the task and the due date reminded of
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True, related_name='reminders', db_index=False)
+    remind_on = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read'], name='notification_user_read_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'user', 'remind_on'], name='notification_reminder_uniq'),
+        ]
 
     def __str__(self):
         return f"notification for {self.user.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'is_read' in field_names:
+            instance._loaded_is_read = instance.is_read
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'is_read' not in update_fields:
+            return super().save(*args, **kwargs)
+        was_read = True if adding else getattr(self, '_loaded_is_read', None)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if was_read is not None:
+                NotificationCounter.objects.adjust({self.user_id: int(was_read) - int(self.is_read)})
+        self._loaded_is_read = self.is_read
+
+
+class NotificationCounterManager(models.Manager):
+    def adjust(self, deltas):
+        """Apply {user_id: delta} to the unread counters, creating missing rows."""
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        with transaction.atomic():
+            self.bulk_create([self.model(user_id=user_id) for user_id in deltas], ignore_conflicts=True)
+            by_delta = {}
+            for user_id, delta in deltas.items():
+                by_delta.setdefault(delta, []).append(user_id)
+            for delta, user_ids in by_delta.items():
+                self.filter(user_id__in=user_ids).update(unread=Greatest(F('unread') + delta, 0))
+
+    def unread_for(self, user):
+        return self.filter(user_id=user.pk).values_list('unread', flat=True).first() or 0
+
+
+class NotificationCounter(models.Model):
+    """Denormalized count of a user's unread notifications, kept current by
+    Notification.save(), the post_delete signal and the bulk read actions."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    objects = NotificationCounterManager()
     
-class Schedule(models.Model):
+class TaskStatusCountManager(models.Manager):
+    def adjust(self, deltas):
+        """Apply {(project_id, status, private_to): delta} to the counts. Only
+        increments create missing rows, so decrements from a cascading project
+        delete never insert rows for the project being removed."""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        with transaction.atomic():
+            self.bulk_create([
+                self.model(project_id=project_id, status=status, private_to=private_to)
+                for (project_id, status, private_to), delta in deltas.items() if delta > 0
+            ], ignore_conflicts=True)
+            by_delta = {}
+            for (project_id, status, private_to), delta in deltas.items():
+                by_delta.setdefault(delta, Q())
+                by_delta[delta] |= Q(project_id=project_id, status=status, private_to=private_to)
+            for delta, keys in by_delta.items():
+                self.filter(keys).update(count=Greatest(F('count') + delta, 0))
+
+    def rebuild(self, project_ids=None):
+        """Recount from the task table, for all projects or just `project_ids`."""
+        tasks = Task.objects.all() if project_ids is None else Task.objects.filter(project_id__in=project_ids)
+        rows = tasks.annotate(
+            private_to=Case(When(is_public=True, then=Value(0)), default=F('assigned_to_id'), output_field=models.BigIntegerField()),
+        ).values('project_id', 'status', 'private_to').annotate(total=Count('id')).order_by()
+        with transaction.atomic():
+            (self.all() if project_ids is None else self.filter(project_id__in=project_ids)).delete()
+            self.bulk_create((
+                self.model(project_id=row['project_id'], status=row['status'], private_to=row['private_to'], count=row['total'])
+                for row in rows
+            ), batch_size=1000)
+
+
+class TaskStatusCount(models.Model):
+    """Materialized number of a project's tasks per status, kept current by the
+    Task signals and the bulk task actions. Private tasks are counted apart
+    under their assignee (`private_to`, 0 for public tasks) so a board header
+    only adds up the rows its viewer may see."""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='task_status_counts')
+    status = models.CharField(max_length=100, choices=Task.STATUS_CHOICES)
+    private_to = models.BigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = TaskStatusCountManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'status', 'private_to'], name='taskstatuscount_key_uniq'),
+        ]
+
+    @staticmethod
+    def key_for(task):
+        return task.project_id, task.status, 0 if task.is_public else task.assigned_to_id
+
+
+class Schedule(SyncedModel):
+    sync_audience = ('project_id', 'scheduled_by_id', None)
     title = models.CharField(max_length=200)
     start_time = models.DateTimeField(blank=False, db_index=True)
     end_time = models.DateTimeField(blank=False)
@@ -80,6 +307,69 @@ class Schedule(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='project_schedules')
     is_team_event = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'start_time', 'end_time'], name='schedule_project_range_idx'),
+        ]
+
     def __str__(self):
         return f"scheduled {self.title} under project {self.project.title} starting {self.start_time}"
     
+
+
+class SearchDocument(models.Model):
+    """One indexed Message, Task or Resource; `body` is the concatenated text
+    (FULLTEXT-indexed on MySQL), `postings` its inverted index entries."""
+    KIND_CHOICES = [
+        ('message', 'Message'),
+        ('task', 'Task'),
+        ('resource', 'Resource'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='search_documents')
+    body = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchdocument_object_uniq'),
+        ]
+
+
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='postings')
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'document'], name='searchposting_term_doc_uniq'),
+        ]
+
+
+class ChangeLogEntry(models.Model):
+    """One upsert or tombstone in the /sync/ change feed. The audience columns
+    are copied from the row at the time of the change, without foreign keys,
+    so tombstones outlive what they point at."""
+    KIND_CHOICES = [
+        ('project', 'Project'),
+        ('task', 'Task'),
+        ('message', 'Message'),
+        ('resource', 'Resource'),
+        ('schedule', 'Schedule'),
+        ('notification', 'Notification'),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    project_id = models.BigIntegerField(null=True)
+    user_id = models.BigIntegerField(null=True)
+    is_public = models.BooleanField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'id'], name='changelog_user_idx'),
+            models.Index(fields=['project_id', 'id'], name='changelog_project_idx'),
+        ]
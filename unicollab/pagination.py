@@ -0,0 +1,180 @@
+import base64
+import json
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_filter(ordering, position):
+    """Rows strictly after `position` in `ordering`, i.e. the row-value comparison
+    (a, b) > (x, y) spelled as `a >= x AND (a > x OR (a = x AND b > y))` so the
+    leading column stays a sargable index range."""
+    first = ordering[0]
+    bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+    after = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        condition = Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": position[i]})
+        for previous, value in zip(ordering[:i], position[:i]):
+            condition &= Q(**{previous.lstrip('-'): value})
+        after |= condition
+    return bound & after
+
+
+def encode_value(value):
+    # full-precision isoformat; DjangoJSONEncoder truncates microseconds
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite, unique ordering without OFFSET.
+
+    Views declare `ordering`, e.g. `('timestamp', 'id')`; the cursor carries the
+    ordering values of the boundary row, so fetching any page costs one indexed
+    range scan of `page_size + 1` rows regardless of how deep it is.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def page_size(self):
+        return api_settings.PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'UNICOLLAB_MAX_PAGE_SIZE', 200)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'ordering', None) or self.ordering)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset, position = self.start_page(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.build_page(list(page_queryset), position)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views; `request` needs `query_params`."""
+        page_queryset, position = self.start_page(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.build_page([row async for row in page_queryset], position)
+
+    def start_page(self, queryset, request, view):
+        """(page queryset, cursor position); the queryset is None when paging is off."""
+        self.page_size_value = self.get_page_size(request)
+        if not self.page_size_value:
+            return None, None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+        self.model = queryset.model
+        position, self.reverse = self.decode_cursor(request)
+        return self.get_page_queryset(queryset, position), position
+
+    def get_page_queryset(self, queryset, position):
+        ordering = reverse_ordering(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, position))
+        return queryset[:self.page_size_value + 1]
+
+    def build_page(self, rows, position):
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def get_position(self, row):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, Mapping):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, default=encode_value, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), True)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,231 @@
+"""
+Sampled request profiling.
+
+`ProfilingMiddleware` profiles a `UNICOLLAB_PROFILING_SAMPLE_RATE` fraction of
+requests: it counts and times SQL queries on every connection, times
+serialization (`serializer.data` of the viewsets, through
+`ProfiledSerializerMixin`, and the values() lists) and response rendering
+through `ProfiledJSONRenderer`, the default renderer, flags SQL statements repeated at least
+`UNICOLLAB_PROFILING_N_PLUS_ONE` times in one request, adds a `Server-Timing`
+header and records the request into an in-process histogram per view and
+action, served in Prometheus text format by `unicollab.views.MetricsView`. Unsampled requests
+only pay for one random() call.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('unicollab_profile', default=None)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.label = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+    def server_timing(self, total, duplicates):
+        metrics = [
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+            f'ser;dur={self.serializer_time * 1000:.2f}',
+            f'render;dur={self.render_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        if duplicates:
+            metrics.append(f'dup;desc="{sum(duplicates.values())} repeated queries"')
+        return ', '.join(metrics)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, seconds, queries, db_seconds):
+        with self._lock:
+            series = self._series.setdefault(labels, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'queries': 0, 'db': 0.0})
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+            series['queries'] += queries
+            series['db'] += db_seconds
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = {labels: {**values, 'buckets': list(values['buckets'])} for labels, values in self._series.items()}
+        lines = [
+            '# HELP unicollab_request_duration_seconds Sampled request latency by view and action.',
+            '# TYPE unicollab_request_duration_seconds histogram',
+        ]
+        for (view, action), values in sorted(series.items()):
+            labels = f'view="{view}",action="{action}"'
+            for bound, count in zip(self.buckets, values['buckets']):
+                lines.append(f'unicollab_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'unicollab_request_duration_seconds_bucket{{{labels},le="+Inf"}} {values["count"]}')
+            lines.append(f'unicollab_request_duration_seconds_sum{{{labels}}} {values["sum"]:.6f}')
+            lines.append(f'unicollab_request_duration_seconds_count{{{labels}}} {values["count"]}')
+        for name, key, help_text in (
+            ('unicollab_request_queries_total', 'queries', 'SQL queries issued by sampled requests.'),
+            ('unicollab_request_db_seconds_total', 'db', 'Time spent in SQL by sampled requests.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (view, action), values in sorted(series.items()):
+                lines.append(f'{name}{{view="{view}",action="{action}"}} {values[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+REQUEST_HISTOGRAM = Histogram()
+
+
+def view_label(view_func, request):
+    method = request.method.lower()
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'view'), method
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method, method)
+
+
+@contextmanager
+def serializing():
+    """Count the block as serialization time in the sampled request's profile."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serializer_time += time.perf_counter() - start
+
+
+class ProfiledSerializerMixin:
+    """GenericAPIView mixin timing the `data` of the serializers it hands out,
+    nested serializers and the queries they trigger included. In a sampled
+    request the serializer's own to_representation is wrapped; unsampled ones
+    get the serializer untouched."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _current.get() is not None:
+            to_representation = serializer.to_representation
+
+            def timed(instance):
+                with serializing():
+                    return to_representation(instance)
+
+            serializer.to_representation = timed
+        return serializer
+
+
+class ProfiledJSONRenderer(JSONRenderer):
+    """JSONRenderer that adds its time to the sampled request's profile. Nothing
+    is patched, so unsampled requests only pay for a ContextVar read."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        profile = _current.get()
+        if profile is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            profile.render_time += time.perf_counter() - start
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def sampled():
+        rate = getattr(settings, 'UNICOLLAB_PROFILING_SAMPLE_RATE', 0.0)
+        return rate and random.random() < rate
+
+    @contextmanager
+    def profiling(self, profile):
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                yield
+        finally:
+            _current.reset(token)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        start = time.perf_counter()
+        with self.profiling(profile):
+            response = self.get_response(request)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        start = time.perf_counter()
+        with self.profiling(profile):
+            response = await self.get_response(request)
+        return self.report(request, response, profile, time.perf_counter() - start)
+
+    def report(self, request, response, profile, total):
+        duplicates = profile.duplicates(getattr(settings, 'UNICOLLAB_PROFILING_N_PLUS_ONE', 5))
+        for sql, count in duplicates.items():
+            logger.warning('Possible N+1: %d executions in %s %s of %s', count, request.method, request.path, sql)
+        response['Server-Timing'] = profile.server_timing(total, duplicates)
+        labels = profile.label or ('unresolved', request.method.lower())
+        REQUEST_HISTOGRAM.observe(labels, total, profile.queries, profile.db_time)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.label = view_label(view_func, request)
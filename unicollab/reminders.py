@@ -0,0 +1,77 @@
+"""
+Deadline reminders, generated by `manage.py send_reminders`.
+
+Every unfinished task due within the next `UNICOLLAB_REMINDER_DAYS` days gets
+one 'reminder' notification for its assignee, tagged with the task and the due
+date it was sent for. Tasks are scanned in `(due_date, id)` order, chunk by
+chunk, through the due_date index. Each chunk is one query that leaves out the
+tasks already reminded with a NOT EXISTS anti-join against the notification
+unique key, then one bulk insert. Memory stays bounded by the chunk size.
+
+Runs may overlap, e.g. cron firing again before a slow run finished. Before
+inserting, a chunk locks its tasks and repeats the anti-join: a run that
+reaches the same tasks second waits for the first to commit, then finds the
+reminders already there and skips them, so the insert never hits the unique
+key and the counters and sync log only count what was inserted.
+
+A run that is stopped part way keeps the chunks it committed, and running
+again, or on the next schedule, only fills the gaps. Moving a task's due date
+earns it a fresh reminder for the new date.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .fanout import create_notifications
+from .models import Task, Notification
+from .pagination import keyset_filter
+
+ORDERING = ('due_date', 'id')
+
+
+def reminder_content(title, due_date, today):
+    days = (due_date - today).days
+    when = 'today' if days == 0 else 'tomorrow' if days == 1 else f'on {due_date.isoformat()}'
+    return f'Reminder: "{title}" is due {when}.'
+
+
+def pending_reminders(start, end):
+    """Unfinished tasks due in [start, end] whose assignee has not yet been
+    reminded of their current due date."""
+    reminded = Notification.objects.filter(task=OuterRef('pk'), user=OuterRef('assigned_to'), remind_on=OuterRef('due_date'))
+    return Task.objects.filter(due_date__gte=start, due_date__lte=end).exclude(status='done').filter(~Exists(reminded))
+
+
+def remind(task_ids, today, end):
+    """Create the reminders `task_ids` are still missing; returns how many."""
+    with transaction.atomic():
+        list(Task.objects.select_for_update().filter(pk__in=task_ids).values_list('id', flat=True))
+        # read after the lock, so it sees what an overlapping run committed
+        rows = pending_reminders(today, end).filter(pk__in=task_ids).values_list('id', 'due_date', 'assigned_to_id', 'title')
+        return len(create_notifications([
+            Notification(
+                user_id=user_id, type='reminder', task_id=task_id, remind_on=due_date,
+                content=reminder_content(title, due_date, today),
+            )
+            for task_id, due_date, user_id, title in rows
+        ]))
+
+
+def send_reminders(today=None, days=None, chunk_size=None):
+    """Create the missing reminders; returns how many were created."""
+    today = today or timezone.localdate()
+    days = getattr(settings, 'UNICOLLAB_REMINDER_DAYS', 1) if days is None else days
+    chunk_size = chunk_size or getattr(settings, 'UNICOLLAB_REMINDER_CHUNK_SIZE', 5000)
+    end = today + timedelta(days=days)
+    tasks = pending_reminders(today, end).order_by(*ORDERING).values_list('id', 'due_date')
+    created, position = 0, None
+    while True:
+        rows = list((tasks if position is None else tasks.filter(keyset_filter(ORDERING, position)))[:chunk_size])
+        if rows:
+            created += remind([task_id for task_id, _ in rows], today, end)
+        if len(rows) < chunk_size:
+            return created
+        position = rows[-1][1], rows[-1][0]
@@ -0,0 +1,128 @@
+"""
+Read-replica routing.
+
+Viewsets using `ReplicaReadMixin` send the reads of safe-method requests to one
+of the `UNICOLLAB_READ_REPLICAS` aliases; everything else, including the
+authentication lookup that precedes the choice, goes to `default`. After a
+successful write, `ReplicaPinMiddleware` pins the user to `default` for
+`UNICOLLAB_REPLICA_PIN_SECONDS` so they read their own writes while the
+replicas catch up. A replica that fails to connect is skipped for
+`UNICOLLAB_REPLICA_RETRY_SECONDS`.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .authentication import get_auth_cache
+
+logger = logging.getLogger(__name__)
+
+_read_alias = ContextVar('unicollab_read_alias', default=None)
+_down_until = {}
+
+
+def read_replicas():
+    return getattr(settings, 'UNICOLLAB_READ_REPLICAS', [])
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def is_pinned(user):
+    # the shared auth cache, so a pin set by one worker is seen by all of them
+    return user.is_authenticated and get_auth_cache().get(pin_key(user.pk)) is not None
+
+
+def pin(user):
+    get_auth_cache().set(pin_key(user.pk), 1, getattr(settings, 'UNICOLLAB_REPLICA_PIN_SECONDS', 5))
+
+
+def choose_replica():
+    """A replica alias that accepts connections, or None to read from default."""
+    now = time.monotonic()
+    candidates = [alias for alias in read_replicas() if _down_until.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Read replica %s is unavailable', alias, exc_info=True)
+            _down_until[alias] = now + getattr(settings, 'UNICOLLAB_REPLICA_RETRY_SECONDS', 30)
+            continue
+        return alias
+    return None
+
+
+def route_reads(request):
+    if request.method in SAFE_METHODS and read_replicas() and not is_pinned(request.user):
+        _read_alias.set(choose_replica())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        route_reads(request)
+
+
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self.pin_writer(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _read_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if request.method not in SAFE_METHODS:
+            # request.user may still be a lazy session lookup
+            await sync_to_async(self.pin_writer)(request, response)
+        return response
+
+    @staticmethod
+    def pin_writer(request, response):
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and user is not None and user.is_authenticated:
+            pin(user)
@@ -0,0 +1,24 @@
+def overlapping(queryset, start, end):
+    """Events overlapping the half-open window [start, end)."""
+    return queryset.filter(start_time__lt=end, end_time__gt=start)
+
+
+def merge_intervals(intervals):
+    """Sweep over (start, end) pairs sorted by start and merge the ones that
+    overlap or touch. Runs in O(n) over the already-ordered query result."""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def busy_timeline(queryset, start, end):
+    rows = overlapping(queryset, start, end).order_by('start_time').values_list('start_time', 'end_time')
+    return [
+        {'start': max(busy_start, start), 'end': min(busy_end, end)}
+        for busy_start, busy_end in merge_intervals(rows.iterator())
+    ]
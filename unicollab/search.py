@@ -0,0 +1,172 @@
+"""
+Full-text search over messages, tasks and resources.
+
+Every searchable row has a SearchDocument holding its text. On backends without
+a native full-text index the document also gets one SearchPosting per distinct
+term, weighted by term frequency times field weight, and a query is an equality
+probe of the (term, document) unique index per query term, grouped by document
+and ranked by summed weight. On MySQL the FULLTEXT index on `body` (migration
+0007) does the matching and ranking with MATCH ... AGAINST instead. Neither
+path scans with LIKE '%term%'.
+
+The index is maintained on save by `unicollab.signals`; bulk writes that
+bypass the signals call `index_objects` themselves.
+"""
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, FloatField, Func, Q, Sum
+
+from .models import Task, Resource, Message, SearchDocument, SearchPosting, bulk_create_with_pks
+from .visibility import visible_tasks, visible_resources, visible_messages
+
+TOKEN_RE = re.compile(r'\w+')
+# InnoDB's default innodb_ft_min_token_size: FULLTEXT never indexes shorter
+# words, so the postings leave them out as well and both backends match alike
+MIN_TERM_LENGTH = 3
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 10
+
+# kind -> (model, {field: weight}, visibility rule)
+INDEXED = {
+    'message': (Message, {'content': 1}, visible_messages),
+    'task': (Task, {'title': 3, 'description': 1}, visible_tasks),
+    'resource': (Resource, {'title': 3}, visible_resources),
+}
+KINDS = {model: kind for kind, (model, _, _) in INDEXED.items()}
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text.lower()) if len(token) >= MIN_TERM_LENGTH]
+
+
+def uses_fulltext():
+    return connection.vendor == 'mysql'
+
+
+def indexed_fields(model):
+    return {*INDEXED[KINDS[model]][1], 'project'}
+
+
+def document_for(instance):
+    """(body, {term: weight}) for a Message, Task or Resource."""
+    fields = INDEXED[KINDS[type(instance)]][1]
+    weights = Counter()
+    for field, weight in fields.items():
+        for term in tokenize(getattr(instance, field)):
+            weights[term] += weight
+    return '\n'.join(getattr(instance, field) for field in fields), weights
+
+
+def index_object(instance):
+    """Bring one object's document up to date, rewriting only the postings
+    whose weight changed."""
+    kind = KINDS[type(instance)]
+    body, weights = document_for(instance)
+    document = SearchDocument.objects.filter(kind=kind, object_id=instance.pk).first()
+    if document is not None and document.body == body and document.project_id == instance.project_id:
+        return
+    with transaction.atomic():
+        created = document is None
+        if created:
+            document = SearchDocument.objects.create(kind=kind, object_id=instance.pk, project_id=instance.project_id, body=body)
+        else:
+            document.body, document.project_id = body, instance.project_id
+            document.save(update_fields=['body', 'project'])
+        if uses_fulltext():
+            return
+        existing = {} if created else dict(document.postings.values_list('term', 'weight'))
+        stale = [term for term, weight in existing.items() if weights.get(term) != weight]
+        if stale:
+            document.postings.filter(term__in=stale).delete()
+        SearchPosting.objects.bulk_create(
+            SearchPosting(document=document, term=term, weight=weight)
+            for term, weight in weights.items() if existing.get(term) != weight
+        )
+
+
+def index_objects(objects, batch_size=500):
+    """Reindex many saved objects of one model with a fixed number of queries
+    per batch."""
+    objects = list(objects)
+    if not objects:
+        return
+    kind = KINDS[type(objects[0])]
+    with transaction.atomic():
+        for start in range(0, len(objects), batch_size):
+            built = {obj.pk: (obj.project_id, *document_for(obj)) for obj in objects[start:start + batch_size]}
+            documents = {document.object_id: document for document in SearchDocument.objects.filter(kind=kind, object_id__in=built)}
+            for object_id, document in documents.items():
+                document.project_id, document.body, _ = built[object_id]
+            if documents:
+                SearchDocument.objects.bulk_update(documents.values(), ['project', 'body'])
+            new = [
+                SearchDocument(kind=kind, object_id=object_id, project_id=project_id, body=body)
+                for object_id, (project_id, body, _) in built.items() if object_id not in documents
+            ]
+            if uses_fulltext():
+                SearchDocument.objects.bulk_create(new)
+                continue
+            # the postings below point at the new documents' ids
+            created = bulk_create_with_pks(SearchDocument, new, key=('kind', 'object_id'))
+            if documents:
+                SearchPosting.objects.filter(document__in=documents.values()).delete()
+            documents.update((document.object_id, document) for document in created)
+            SearchPosting.objects.bulk_create((
+                SearchPosting(document=document, term=term, weight=weight)
+                for object_id, document in documents.items() for term, weight in built[object_id][2].items()
+            ), batch_size=2000)
+
+
+def remove_object(instance):
+    SearchDocument.objects.filter(kind=KINDS[type(instance)], object_id=instance.pk).delete()
+
+
+def rebuild_index(batch_size=500):
+    """Drop and rebuild every document; returns {kind: documents indexed}."""
+    counts = {}
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for kind, (model, fields, _) in INDEXED.items():
+            batch, counts[kind] = [], 0
+            for obj in model.objects.only('pk', 'project', *fields).order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(obj)
+                if len(batch) == batch_size:
+                    index_objects(batch, batch_size)
+                    counts[kind] += len(batch)
+                    batch = []
+            index_objects(batch, batch_size)
+            counts[kind] += len(batch)
+    return counts
+
+
+class MatchAgainst(Func):
+    output_field = FloatField()
+
+    def __init__(self, expression, query):
+        super().__init__(expression)
+        self.query = query
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'MATCH ({sql}) AGAINST (%s IN BOOLEAN MODE)', (*params, self.query)
+
+
+def search(user, query, kinds=None, limit=50):
+    """[(kind, object_id, score)] for the documents `user` may see that contain
+    every term of `query`, best match first."""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    visible = Q()
+    for kind in kinds or INDEXED:
+        visible |= Q(kind=kind, object_id__in=INDEXED[kind][2](user).values('pk'))
+    documents = SearchDocument.objects.filter(visible)
+    if uses_fulltext():
+        documents = documents.annotate(score=MatchAgainst('body', ' '.join('+' + term for term in terms))).filter(score__gt=0)
+    else:
+        documents = documents.filter(postings__term__in=terms).annotate(
+            score=Sum('postings__weight'), matched=Count('postings'),
+        ).filter(matched=len(terms))
+    return list(documents.order_by('-score', 'id').values_list('kind', 'object_id', 'score')[:limit])
@@ -1,6 +1,122 @@
+from functools import lru_cache
+
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import User, Project, Task, Resource, Message, Notification, Schedule
-from datetime import date, datetime
+from .models import User, Project, Task, Resource, Message, Notification, Schedule, SearchDocument
+from .visibility import is_member
+from datetime import date
+
+
+def eager_loading_plan(serializer, prefix=''):
+    """Walk a serializer's fields and return the (select_related, prefetch_related)
+    lookups needed to render it without issuing a query per row."""
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        lookup = prefix + '__'.join(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            child_select, child_prefetch = eager_loading_plan(field.child)
+            queryset = field.child.Meta.model.objects.all()
+            if child_select:
+                queryset = queryset.select_related(*child_select)
+            prefetch.append(Prefetch(lookup, queryset=queryset.prefetch_related(*child_prefetch)))
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch.append(lookup)
+        elif isinstance(field, serializers.BaseSerializer):
+            child_select, child_prefetch = eager_loading_plan(field, lookup + '__')
+            select += [lookup] + child_select
+            prefetch += child_prefetch
+        elif isinstance(field, serializers.RelatedField) and not field.use_pk_only_optimization():
+            select.append(lookup)
+    return select, prefetch
+
+
+class EagerLoadingMixin:
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select, prefetch = eager_loading_plan(cls())
+        if select:
+            queryset = queryset.select_related(*select)
+        return queryset.prefetch_related(*prefetch)
+
+
+def render_by_id(serializer_class, queryset, ids):
+    """{pk: serialized data} for the rows of `queryset` whose pk is in `ids`."""
+    select, prefetch = eager_loading_plan(serializer_class())
+    queryset = queryset.select_related(*select).prefetch_related(*prefetch).filter(pk__in=ids)
+    return {obj.pk: serializer_class(obj).data for obj in queryset}
+
+
+class CachedSlugRelatedField(serializers.SlugRelatedField):
+    """SlugRelatedField that reads from `context['slug_cache']` (see `resolve_slugs`)
+    when a bulk request has pre-resolved every slug up front."""
+
+    def to_internal_value(self, data):
+        cache = self.context.get('slug_cache', {}).get(self.field_name)
+        if cache is None:
+            return super().to_internal_value(data)
+        matches = cache.get(str(data))
+        if not matches:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=str(data))
+        if len(matches) > 1:
+            self.fail('invalid')
+        return matches[0]
+
+
+def resolve_slugs(serializer_class, items):
+    """Resolve every CachedSlugRelatedField value in `items` with one IN query per field."""
+    cache = {}
+    for name, field in serializer_class().fields.items():
+        if not isinstance(field, CachedSlugRelatedField) or field.read_only:
+            continue
+        values = {str(item[name]) for item in items if isinstance(item, dict) and item.get(name) is not None}
+        resolved = cache[name] = {}
+        for obj in field.get_queryset().filter(**{f'{field.slug_field}__in': values}):
+            resolved.setdefault(str(getattr(obj, field.slug_field)), []).append(obj)
+    return cache
+
+
+class ValuesMapper:
+    """Renders `values()` rows exactly as `serializer_class(many=True).data`
+    renders the model instances. Supports plain fields plus slug and primary
+    key related fields; each field's lookup and converter is worked out once."""
+    # fields whose to_representation is the identity on values() output
+    passthrough = (serializers.CharField, serializers.BooleanField, serializers.IntegerField)
+
+    def __init__(self, serializer_class):
+        self.fields = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source or isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                raise TypeError(f'{serializer_class.__name__}.{name} cannot be rendered from values()')
+            if isinstance(field, serializers.SlugRelatedField):
+                lookup, convert = f'{field.source}__{field.slug_field}', None
+            elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+                lookup, convert = field.source, None
+            elif isinstance(field, serializers.RelatedField):
+                raise TypeError(f'{serializer_class.__name__}.{name} cannot be rendered from values()')
+            else:
+                lookup, convert = field.source, None if isinstance(field, self.passthrough) else field.to_representation
+            self.fields.append((name, lookup, convert))
+        self.lookups = [lookup for _, lookup, _ in self.fields]
+
+    def values(self, queryset, *extra):
+        return queryset.values(*dict.fromkeys([*self.lookups, *extra]))
+
+    def render(self, rows):
+        fields = self.fields
+        return [
+            {name: row[lookup] if convert is None or row[lookup] is None else convert(row[lookup]) for name, lookup, convert in fields}
+            for row in rows
+        ]
+
+
+@lru_cache(maxsize=None)
+def values_mapper(serializer_class):
+    return ValuesMapper(serializer_class)
+
 
 class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,8 +125,8 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = ['title', 'description', 'is_public', 'created_by', 'members']
 
 class TaskSerializer(serializers.ModelSerializer):
-    project = serializers.SlugRelatedField(slug_field='title', queryset=Project.objects.all())
-    assigned_to = serializers.SlugRelatedField(slug_field='username', queryset=User.objects.all())
+    project = CachedSlugRelatedField(slug_field='title', queryset=Project.objects.all())
+    assigned_to = CachedSlugRelatedField(slug_field='username', queryset=User.objects.all())
     due_date = serializers.DateField()
 
     class Meta:
@@ -31,21 +147,35 @@ class ResourceSerializer(serializers.ModelSerializer):
     uploaded_by = serializers.SlugRelatedField(slug_field='username', queryset=User.objects.all())
     class Meta:
         model = Resource
-        fields = '__all__'
+        exclude = ['file']
         read_only_fields = ['uploaded_by', 'timestamp','project']
 
+
+class ResourceUploadSerializer(serializers.ModelSerializer):
+    project = serializers.SlugRelatedField(slug_field='title', queryset=Project.objects.all())
+
+    class Meta:
+        model = Resource
+        fields = ['title', 'is_public', 'project']
+
+    def validate_project(self, project):
+        if not is_member(self.context['request'].user, project.pk):
+            raise serializers.ValidationError("you must be a member to upload to this project")
+        return project
+
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model =  Message
         fields = '__all__'
-        read_only_fields = ['sender', 'timestamp', 'project']
+        read_only_fields = ['sender', 'timestamp']
 
     def validate(self, attrs):
-        project = attrs['project']
+        # a partial update may leave the project out
+        project_id = attrs['project'].pk if 'project' in attrs else self.instance.project_id
         request = self.context.get('request')
         user = request.user
 
-        if not project.members.filter(id=user.id).exists():
+        if not is_member(user, project_id):
             raise serializers.ValidationError("you must be a member to send a message")
         return attrs
 
@@ -55,7 +185,7 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
-        read_only_fields = ['user']
+        read_only_fields = ['user', 'task', 'remind_on']
 
 class ScheduleSerializer(serializers.ModelSerializer):
     start_time = serializers.DateTimeField()
@@ -68,15 +198,57 @@ class ScheduleSerializer(serializers.ModelSerializer):
         read_only_fields = ['scheduled_by', 'project']
 
     def validate(self, attrs):
-        start_time = attrs.get('start_time')
-        end_time = attrs.get('end_time')
-        
-        if start_time > end_time and end_time < datetime.now():
+        start_time = attrs.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = attrs.get('end_time', getattr(self.instance, 'end_time', None))
+
+        if start_time and end_time and end_time <= start_time:
             raise serializers.ValidationError("there's an error with your time plan. End time is incorrect")
         return attrs
 
 
-class UserSerializer(serializers.ModelSerializer):
+class ScheduleRangeSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs['end'] <= attrs['start']:
+            raise serializers.ValidationError({"end": "End must be after start."})
+        return attrs
+
+
+class ScheduleConflictSerializer(ScheduleRangeSerializer):
+    project = serializers.IntegerField()
+    exclude = serializers.IntegerField(required=False)
+
+
+class MembershipChangeSerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate_users(self, value):
+        ids = set(value)
+        found = set(User.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if ids - found:
+            raise serializers.ValidationError(f"Unknown users: {', '.join(map(str, sorted(ids - found)))}.")
+        return sorted(ids)
+
+
+class TaskFilterSerializer(serializers.Serializer):
+    """TaskViewSet.filterset_fields for the async list, validated without queries."""
+    project = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=Task.STATUS_CHOICES, required=False)
+    priority = serializers.ChoiceField(choices=Task.PRIORITY_CHOICES, required=False)
+
+
+class NotificationFilterSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=Notification.NOTIFICATION_TYPE_CHOICES, required=False)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField()
+    type = serializers.ChoiceField(choices=SearchDocument.KIND_CHOICES, required=False)
+
+
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     project = ProjectSerializer(many=True, read_only=True, source='created_projects')
     tasks = TaskSerializer(many=True, read_only=True, source='assigned_tasks')
     notifications = NotificationSerializer(many=True, read_only=True, source='user_notifications')
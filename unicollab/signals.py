@@ -0,0 +1,267 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from .archive import is_archiving
+from .authentication import invalidate_tokens
+from .board import count_moves, lock_stored_keys, saves_board_key
+from .files import release
+from .fanout import assignment_event, current_actor, message_event, submit_on_commit, team_event
+from .caching import RESOURCES, bump, bump_member_lists, project_dashboard_key, project_members_key
+from .models import User, Project, Task, Resource, Message, Notification, NotificationCounter, Schedule, TaskStatusCount
+from .sync import SYNCED, audience_fields, previous_audience, record_changes, record_membership
+from .search import index_object, indexed_fields, remove_object
+from .serializers import MessageSerializer
+from .streaming import get_hub
+from .visibility import forget_memberships
+
+
+def archived(sender):
+    # archive_batch moves messages out with a delete, and updates the search
+    # index and dashboards itself; archived messages get no sync tombstone
+    return sender is Message and is_archiving()
+
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    def publish():
+        hub = get_hub()
+        if hub.has_subscribers(instance.project_id):
+            hub.publish(instance.project_id, instance.id, JSONRenderer().render(MessageSerializer(instance).data).decode('utf-8'))
+    transaction.on_commit(publish)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    # again on commit: a request that read the row before the delete committed
+    # may have cached it in between
+    key = instance.key
+    invalidate_tokens(key)
+    transaction.on_commit(lambda: invalidate_tokens(key))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        keys = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+        invalidate_tokens(*keys)
+        transaction.on_commit(lambda: invalidate_tokens(*keys))
+
+
+@receiver(pre_save, sender=Task)
+def remember_board_key(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Task.save runs in a transaction, so the row stays locked until the counts
+    # have moved; the locked read also gives the sync feed the stored audience
+    if raw or instance._state.adding or not saves_board_key(update_fields):
+        return
+    stored = lock_stored_keys([instance.pk]).get(instance.pk)
+    if stored is not None:
+        instance._stored_board_key, instance._loaded_audience = stored
+
+
+@receiver(post_save, sender=Task)
+def count_saved_task(sender, instance, created, update_fields=None, **kwargs):
+    if not created and not saves_board_key(update_fields):
+        return
+    key = TaskStatusCount.key_for(instance)
+    old = None if created else instance.__dict__.pop('_stored_board_key', None)
+    TaskStatusCount.objects.adjust(count_moves([(old, key)]))
+    instance._loaded_board_key = key
+
+
+@receiver(post_delete, sender=Task)
+def uncount_deleted_task(sender, instance, **kwargs):
+    TaskStatusCount.objects.adjust(count_moves([(getattr(instance, '_loaded_board_key', TaskStatusCount.key_for(instance)), None)]))
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        NotificationCounter.objects.adjust({instance.user_id: -1})
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def bump_resource_lists(sender, instance, **kwargs):
+    bump(RESOURCES)
+    bump_member_lists(instance.uploaded_by_id)
+
+
+@receiver(post_delete, sender=Resource)
+def release_resource_file(sender, instance, **kwargs):
+    if instance.file:
+        name, sha256 = instance.file.name, instance.sha256
+        transaction.on_commit(lambda: release(name, sha256))
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def bump_project_lists(sender, instance, **kwargs):
+    # resource rows embed the project title, member profiles embed created projects
+    bump(RESOURCES, project_members_key(instance.pk), project_dashboard_key(instance.pk))
+    bump_member_lists(instance.created_by_id)
+
+
+@receiver(m2m_changed, sender=Project.members.through)
+def bump_membership_lists(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        project_ids = [instance.pk]
+    elif action == 'pre_clear':
+        project_ids = instance.project_members.values_list('id', flat=True)
+    else:
+        project_ids = pk_set
+    # dashboards are cached per user and filtered by membership
+    bump(*(key for project_id in project_ids for key in (project_members_key(project_id), project_dashboard_key(project_id))))
+
+
+@receiver(m2m_changed, sender=Project.members.through)
+def forget_changed_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        user_ids = [instance.pk]
+        instance.__dict__.pop('_member_project_ids', None)
+    elif action == 'pre_clear':
+        user_ids = list(instance.members.values_list('id', flat=True))
+    else:
+        user_ids = list(pk_set)
+    # again on commit, in case a concurrent request cached the pre-commit set
+    forget_memberships(*user_ids)
+    transaction.on_commit(lambda: forget_memberships(*user_ids))
+
+
+@receiver(pre_delete, sender=Project)
+def forget_deleted_project_members(sender, instance, **kwargs):
+    # the through rows are deleted by the cascade, which sends no m2m_changed
+    user_ids = list(instance.members.values_list('id', flat=True))
+    forget_memberships(*user_ids)
+    transaction.on_commit(lambda: forget_memberships(*user_ids))
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def bump_user_lists(sender, instance, **kwargs):
+    bump(RESOURCES)
+    bump_member_lists(instance.pk)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def bump_task_member_lists(sender, instance, **kwargs):
+    bump_member_lists(instance.assigned_to_id)
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def bump_notification_member_lists(sender, instance, **kwargs):
+    bump_member_lists(instance.user_id)
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def bump_schedule_member_lists(sender, instance, **kwargs):
+    bump_member_lists(instance.scheduled_by_id)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def bump_project_dashboard(sender, instance, **kwargs):
+    if archived(sender):
+        return
+    # a row moved to another project leaves the old dashboard to expire
+    # after UNICOLLAB_DASHBOARD_CACHE_TTL
+    bump(project_dashboard_key(instance.project_id))
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Resource)
+def index_search_document(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not indexed_fields(sender).isdisjoint(update_fields):
+        index_object(instance)
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Resource)
+def remove_search_document(sender, instance, **kwargs):
+    if not archived(sender):
+        remove_object(instance)
+
+
+@receiver(post_save, sender=Message)
+def notify_project_message(sender, instance, created, **kwargs):
+    if created:
+        submit_on_commit(message_event(instance))
+
+
+@receiver(post_save, sender=Task)
+def notify_task_assignment(sender, instance, created, **kwargs):
+    if created or instance.assigned_to_id != getattr(instance, '_loaded_assigned_to_id', instance.assigned_to_id):
+        submit_on_commit(assignment_event(instance, current_actor()))
+    instance._loaded_assigned_to_id = instance.assigned_to_id
+
+
+@receiver(post_save, sender=Schedule)
+def notify_team_event(sender, instance, created, **kwargs):
+    if created and instance.is_team_event:
+        submit_on_commit(team_event(instance))
+
+
+def remember_audience(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    fields = audience_fields(sender)
+    if update_fields is None or any(field in update_fields or field[:-3] in update_fields for field in fields):
+        instance._sync_previous = previous_audience(instance)
+
+
+def record_saved_change(sender, instance, created=False, raw=False, **kwargs):
+    saved_audience = created or '_sync_previous' in instance.__dict__
+    previous = instance.__dict__.pop('_sync_previous', None)
+    record_changes([instance], previous={instance.pk: previous} if previous else None)
+    if saved_audience:
+        # the stored audience is now this one; the next save tombstones it
+        instance._loaded_audience = instance.audience()
+
+
+def record_deleted_change(sender, instance, **kwargs):
+    if not archived(sender):
+        record_changes([instance], deleted=True)
+
+
+for model in SYNCED:
+    pre_save.connect(remember_audience, sender=model, dispatch_uid=f'sync-pre-{model.__name__}')
+    post_save.connect(record_saved_change, sender=model, dispatch_uid=f'sync-save-{model.__name__}')
+    post_delete.connect(record_deleted_change, sender=model, dispatch_uid=f'sync-delete-{model.__name__}')
+
+
+@receiver(m2m_changed, sender=Project.members.through)
+def record_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        pk_set = set((instance.project_members if reverse else instance.members).values_list('id', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        record_membership(pk_set, [instance.pk], deleted=action != 'post_add')
+    else:
+        record_membership([instance.pk], pk_set, deleted=action != 'post_add')
+
+
+@receiver(pre_delete, sender=Project)
+def record_project_members_dropped(sender, instance, **kwargs):
+    # the membership rows are gone by post_delete, taking the members' view of the tombstone with them
+    record_membership([instance.pk], instance.members.values_list('id', flat=True), deleted=True)
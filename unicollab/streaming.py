@@ -0,0 +1,161 @@
+"""
+Fan-out of new project messages to streaming (SSE) clients.
+
+The hub is pluggable through `UNICOLLAB_MESSAGE_HUB`. `InProcessHub` delivers
+to subscribers connected to this process only; a deployment running several
+ASGI workers swaps in a backend implementing the same two methods on top of a
+shared broker.
+"""
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+OVERFLOW = object()
+
+
+class BaseMessageHub(ABC):
+    @abstractmethod
+    def publish(self, project_id, event_id, data):
+        """Deliver an already-rendered event to every subscriber of the project.
+        Must be callable from any thread."""
+
+    @abstractmethod
+    def subscribe(self, project_id):
+        """Return an async context manager yielding an object with an async
+        `get(timeout)` method, see `Subscription`."""
+
+    def has_subscribers(self, project_id):
+        """Whether publishing to the project can reach anyone, so publishers can
+        skip rendering the event. Backends that cannot tell say True."""
+        return True
+
+
+class Subscription:
+    """Async context manager registering a queue with the hub for its lifetime."""
+
+    def __init__(self, hub, project_id, max_pending):
+        self.hub = hub
+        self.project_id = project_id
+        self.max_pending = max_pending
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.hub._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.hub._remove(self)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow consumer is cut off rather than buffered without bound;
+            # it reconnects with Last-Event-ID and replays from the database.
+            self.queue = asyncio.Queue(maxsize=1)
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout=None):
+        """Next `(event_id, data)` pair, `None` on timeout or `OVERFLOW`."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessHub(BaseMessageHub):
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, project_id, event_id, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(project_id, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.put, (event_id, data))
+
+    def subscribe(self, project_id):
+        return Subscription(self, project_id, self.max_pending)
+
+    def has_subscribers(self, project_id):
+        return project_id in self._subscribers
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscribers[subscription.project_id].add(subscription)
+
+    def _remove(self, subscription):
+        with self._lock:
+            self._subscribers[subscription.project_id].discard(subscription)
+            if not self._subscribers[subscription.project_id]:
+                del self._subscribers[subscription.project_id]
+
+
+@lru_cache(maxsize=None)
+def get_hub():
+    return import_string(getattr(settings, 'UNICOLLAB_MESSAGE_HUB', 'unicollab.streaming.InProcessHub'))()
+
+
+def format_event(event_id, data):
+    return f'id: {event_id}\nevent: message\ndata: {data}\n\n'
+
+
+def replay_filter(since, anchor, grace):
+    """Messages a client that last saw message `since` (sent at `anchor`) may
+    have missed. Ids are taken at insert time, not commit time, so a message
+    with a lower id can commit after `since` did; anything sent within `grace`
+    seconds before `since` is replayed as well, and clients drop ids they hold."""
+    missed = Q(id__gt=since)
+    if anchor is not None:
+        missed |= Q(timestamp__gte=anchor - timedelta(seconds=grace)) & ~Q(pk=since)
+    return missed
+
+
+async def message_events(project_id, since=None):
+    """SSE body for one project: replay messages after `since`, then follow live
+    ones. Subscribing before the replay means nothing committed in between is
+    lost. Live events are delivered in commit order, whatever their id; only
+    those the replay already sent are skipped."""
+    from rest_framework.renderers import JSONRenderer
+    from .models import Message
+    from .serializers import MessageSerializer
+
+    heartbeat = getattr(settings, 'UNICOLLAB_STREAM_HEARTBEAT', 15)
+    grace = getattr(settings, 'UNICOLLAB_STREAM_REPLAY_GRACE', 5)
+    renderer = JSONRenderer()
+    async with get_hub().subscribe(project_id) as subscription:
+        # only messages sent shortly before subscribing can still commit and
+        # arrive live after being replayed
+        recent = timezone.now() - timedelta(seconds=grace)
+        replayed = set()
+        if since is not None:
+            messages = Message.objects.filter(project_id=project_id)
+            anchor = await messages.filter(pk=since).values_list('timestamp', flat=True).afirst()
+            replay = messages.filter(replay_filter(since, anchor, grace)).order_by('id')
+            async for message in replay.aiterator(chunk_size=500):
+                yield format_event(message.id, renderer.render(MessageSerializer(message).data).decode('utf-8'))
+                if message.timestamp >= recent:
+                    replayed.add(message.id)
+        yield ': connected\n\n'
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            if event is OVERFLOW:
+                return
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            event_id, data = event
+            if event_id in replayed:
+                replayed.discard(event_id)
+                continue
+            yield format_event(event_id, data)
@@ -0,0 +1,181 @@
+"""
+Change feed behind `GET /sync/`.
+
+Every write to a synced model appends a ChangeLogEntry (signals for single
+saves, `record_changes` from bulk paths). An entry carries the audience of
+the row when it changed: its project, its owning user and its public flag.
+One predicate on those columns matches the visibility rules in
+`unicollab.visibility`, so a client pulls only the entries it could see. When
+an update takes a row away from part of its audience, a tombstone carrying
+the old audience is written before the upsert. The old audience is the one
+the row was loaded with (`SyncedModel`), so an update costs the entry INSERT
+and no extra read.
+
+Membership changes are recorded as `project` entries addressed to the member.
+A project tombstone means the client should drop everything it holds for that
+project.
+
+Entry ids are allocated at INSERT but become visible at COMMIT, so a slow
+transaction can commit an id below one a client has already passed. Cursors
+therefore never move past entries younger than `UNICOLLAB_SYNC_LAG` seconds:
+those are sent again on the next pull, and changes may repeat.
+`manage.py prune_change_log` drops entries older than
+`UNICOLLAB_SYNC_RETENTION_DAYS`; a cursor from before the oldest entry left
+gets 410 and the client starts over.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Project, Task, Resource, Message, Notification, Schedule, ChangeLogEntry
+from .visibility import member_project_ids, visible_projects, visible_tasks, visible_resources, visible_messages, visible_schedules
+
+# model -> kind; the audience columns are each model's `sync_audience`
+SYNCED = {
+    Project: 'project',
+    Task: 'task',
+    Message: 'message',
+    Resource: 'resource',
+    Schedule: 'schedule',
+    Notification: 'notification',
+}
+
+VISIBLE_ROWS = {
+    'project': visible_projects,
+    'task': visible_tasks,
+    'message': visible_messages,
+    'resource': visible_resources,
+    'schedule': visible_schedules,
+    'notification': lambda user: Notification.objects.filter(user=user),
+}
+
+
+def audience_fields(model):
+    return [attname for attname in model.sync_audience if attname and attname != 'id']
+
+
+def audience(instance):
+    return instance.audience()
+
+
+def previous_audience(instance):
+    """The stored audience of an existing row: the one it was loaded with, or
+    read back for rows built by hand or loaded without those columns."""
+    loaded = getattr(instance, '_loaded_audience', None)
+    if loaded is not None:
+        return loaded
+    fields = audience_fields(type(instance))
+    values = type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+    if values is None:
+        return None
+    stored = dict(zip(fields, values), id=instance.pk)
+    return tuple(stored[attname] if attname else None for attname in type(instance).sync_audience)
+
+
+def entry(kind, object_id, project_id, user_id, is_public, deleted=False):
+    return ChangeLogEntry(kind=kind, object_id=object_id, project_id=project_id, user_id=user_id, is_public=is_public, deleted=deleted)
+
+
+def record_changes(objects, deleted=False, previous=None):
+    """Append entries for `objects`; `previous` maps pk -> audience before the
+    write, to tombstone the row for anyone who has lost sight of it. Every
+    object needs its pk: bulk inserts go through `bulk_create_with_pks`."""
+    entries = []
+    for obj in objects:
+        if obj.pk is None:
+            raise ValueError(f'{type(obj).__name__} has no pk to record in the change log')
+        kind = SYNCED[type(obj)]
+        current = audience(obj)
+        old = (previous or {}).get(obj.pk)
+        if old is not None and old != current:
+            entries.append(entry(kind, obj.pk, *old, deleted=True))
+        entries.append(entry(kind, obj.pk, *current, deleted=deleted))
+    ChangeLogEntry.objects.bulk_create(entries)
+
+
+def record_membership(project_ids, user_ids, deleted=False):
+    ChangeLogEntry.objects.bulk_create(
+        entry('project', project_id, None, user_id, None, deleted=deleted)
+        for project_id in project_ids for user_id in user_ids
+    )
+
+
+def _lag():
+    return timedelta(seconds=getattr(settings, 'UNICOLLAB_SYNC_LAG', 5))
+
+
+def oldest():
+    return ChangeLogEntry.objects.order_by('id').values_list('id', flat=True).first()
+
+
+def head():
+    """The newest cursor with nothing left to commit below it: the last entry
+    older than the lag, or just before the whole log when every entry is
+    younger. Walks back from the newest entry over the last lag's writes."""
+    settled = ChangeLogEntry.objects.filter(created_at__lte=timezone.now() - _lag()).order_by('-id').values_list('id', flat=True).first()
+    if settled is None:
+        first = oldest()
+        return first - 1 if first else 0
+    return settled
+
+
+class ExpiredCursor(Exception):
+    pass
+
+
+def visible_entries(user):
+    return ChangeLogEntry.objects.filter(
+        Q(user_id=user.pk)
+        | Q(kind__in=['task', 'resource'], is_public=True)
+        | Q(kind__in=['project', 'message', 'schedule'], project_id__in=member_project_ids(user))
+    )
+
+
+def changes_since(user, since, batch_size=None):
+    """(cursor, more, [(kind, object_id, deleted)]) for up to `batch_size`
+    entries after `since`, keeping only the newest entry per object. Raises
+    ExpiredCursor when entries after `since` have been pruned."""
+    batch_size = batch_size or getattr(settings, 'UNICOLLAB_SYNC_BATCH', 500)
+    first = oldest()
+    if first is not None and since < first - 1:
+        raise ExpiredCursor(since)
+    rows = list(
+        visible_entries(user).filter(id__gt=since).order_by('id')
+        .values_list('id', 'kind', 'object_id', 'deleted', 'created_at')[:batch_size + 1]
+    )
+    more = len(rows) > batch_size
+    rows = rows[:batch_size]
+    latest = {}
+    cursor, cutoff = since, timezone.now() - _lag()
+    for entry_id, kind, object_id, deleted, created_at in rows:
+        latest.pop((kind, object_id), None)
+        latest[kind, object_id] = deleted
+        if created_at <= cutoff:
+            cursor = entry_id
+    if rows and cursor != rows[-1][0]:
+        # the unsettled rows come again next time; a full batch of them must
+        # not have the client spin on the same cursor
+        more = False
+    return cursor, more, [(kind, object_id, deleted) for (kind, object_id), deleted in latest.items()]
+
+
+def prune_change_log(before, batch_size=10000):
+    """Delete the entries created before `before`, oldest first, up to the
+    first younger one, except the newest of them, which keeps marking where
+    the log starts. Walks the primary key only. Returns how many were
+    deleted."""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = ChangeLogEntry.objects.order_by('id').values_list('id', 'created_at')[:batch_size + 1]
+            old = []
+            for pk, created_at in rows:
+                if created_at >= before:
+                    break
+                old.append(pk)
+            if len(old) < 2:
+                return deleted
+            deleted += ChangeLogEntry.objects.filter(id__in=old[:-1]).delete()[0]
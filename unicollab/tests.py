@@ -0,0 +1,1444 @@
+import asyncio
+from contextlib import ExitStack
+import csv
+import hashlib
+import io
+import json
+import re
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from .archive import pack, unpack
+from .authentication import CachedTokenAuthentication, token_cache_key
+from .caching import RESOURCES, project_dashboard_key, project_members_key
+from .benchmarks import QUERY_BUDGETS, UNLOADED_ROUTES, over_budget, route_methods, run_load, seed
+from . import reminders, routers
+from .fanout import Event, ThreadedPipeline
+from .files import blob_name, get_resource_storage
+from .models import User, Project, Task, Resource, ResourceBlob, Message, ArchivedMessage, ChangeLogEntry, Notification, NotificationCounter, Schedule, SearchDocument, TaskStatusCount
+from .profiling import REQUEST_HISTOGRAM, RequestProfile
+from .search import rebuild_index, tokenize
+from .sync import prune_change_log, record_changes
+from .visibility import forget_memberships, projects_of
+from .serializers import TaskSerializer, MessageSerializer, ResourceSerializer, UserSerializer, values_mapper
+from .streaming import InProcessHub, get_hub
+
+
+def without_bulk_insert_ids():
+    """Make bulk_create leave pks unset, as it does on MySQL."""
+    return mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False)
+
+
+def make_user_with_rows(username, rows=3, **extra):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345', **extra)
+    for i in range(rows):
+        project = Project.objects.create(title=f'{username}-project-{i}', description='d', created_by=user)
+        project.members.add(user)
+        Task.objects.create(
+            title=f'{username}-task-{i}', description='d', priority='low', status='to_do',
+            assigned_to=user, due_date=date.today() + timedelta(days=i), project=project,
+        )
+        Resource.objects.create(title=f'{username}-resource-{i}', file_url='https://example.com/f', uploaded_by=user, project=project)
+        Notification.objects.create(user=user, content='hello', type='update')
+        Schedule.objects.create(
+            title=f'{username}-schedule-{i}', start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(hours=1), scheduled_by=user, project=project,
+        )
+    return user
+
+
+class CommittingAPIClient(APIClient):
+    """Runs the on_commit callbacks of each request, as if its writes had
+    committed; TestCase keeps the whole test inside one transaction."""
+
+    def request(self, **kwargs):
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            return super().request(**kwargs)
+
+
+class UnicollabTestCase(APITestCase):
+    client_class = CommittingAPIClient
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+
+class UserQueryPlanTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = make_user_with_rows('staff', is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.staff).key)
+        self.client.get('/users/me/')  # warm the token cache
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_user_list_query_count_is_flat(self):
+        baseline = self.count_queries('/users/')
+        for i in range(5):
+            make_user_with_rows(f'member{i}', rows=4)
+        self.assertEqual(self.count_queries('/users/'), baseline)
+        # users, five nested relations and project members; the token is cached
+        self.assertEqual(baseline, 7)
+
+    def test_me_query_count_is_flat(self):
+        baseline = self.count_queries('/users/me/')
+        for i in range(5):
+            Notification.objects.create(user=self.staff, content='more', type='update')
+        self.assertEqual(self.count_queries('/users/me/'), baseline)
+
+
+class KeysetPaginationTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('walker', rows=3)
+        self.project = Project.objects.filter(created_by=self.user).first()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def walk(self, url):
+        seen, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            url, pages = response.data['next'], pages + 1
+        return seen, pages
+
+    def test_walks_ties_in_timestamp_without_gaps_or_duplicates(self):
+        messages = [Message.objects.create(sender=self.user, content=str(i), project=self.project) for i in range(23)]
+        Message.objects.filter(id__in=[m.id for m in messages[5:15]]).update(timestamp=messages[5].timestamp)
+        seen, pages = self.walk('/messages/?page_size=5')
+        expected = list(Message.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 5)
+
+    def test_previous_link_returns_prior_page(self):
+        for i in range(6):
+            Message.objects.create(sender=self.user, content=str(i), project=self.project)
+        first = self.client.get('/messages/?page_size=3').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([m['id'] for m in back['results']], [m['id'] for m in first['results']])
+
+    def test_page_size_is_capped(self):
+        with self.settings(UNICOLLAB_MAX_PAGE_SIZE=2):
+            response = self.client.get('/tasks/?page_size=100')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/messages/?cursor=garbage').status_code, 404)
+
+
+class VisibilityTests(UnicollabTestCase):
+    def test_member_sender_sees_each_message_once(self):
+        user = make_user_with_rows('sender', rows=1)
+        other = make_user_with_rows('other', rows=0)
+        project = Project.objects.get(created_by=user)
+        project.members.add(other)
+        Message.objects.create(sender=user, content='hi', project=project)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        self.assertEqual(len(self.client.get('/messages/').data['results']), 1)
+        self.assertEqual(len(self.client.get('/projects/').data['results']), 1)
+
+
+class MessageStreamTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('streamer', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        self.token = Token.objects.create(user=self.user).key
+        self.first = Message.objects.create(sender=self.user, content='first', project=self.project)
+        self.second = Message.objects.create(sender=self.user, content='second', project=self.project)
+
+    async def test_hub_fans_out_to_project_subscribers(self):
+        hub = InProcessHub()
+        async with hub.subscribe(1) as a, hub.subscribe(1) as b, hub.subscribe(2) as c:
+            await asyncio.to_thread(hub.publish, 1, 7, '{}')
+            self.assertEqual(await a.get(timeout=1), (7, '{}'))
+            self.assertEqual(await b.get(timeout=1), (7, '{}'))
+            self.assertIsNone(await c.get(timeout=0.01))
+
+    async def test_stream_resumes_after_since_then_follows_live(self):
+        response = await self.async_client.get(
+            f'/projects/{self.project.pk}/stream/', {'since': self.first.pk}, headers={'Authorization': 'Token ' + self.token},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        replayed = (await anext(chunks)).decode()
+        self.assertTrue(replayed.startswith(f'id: {self.second.pk}\n'))
+        self.assertIn('"content":"second"', replayed)
+        self.assertEqual(await anext(chunks), b': connected\n\n')
+        get_hub().publish(self.project.pk, self.second.pk, '{}')
+        get_hub().publish(self.project.pk, self.second.pk + 1, '{"live":true}')
+        self.assertEqual((await anext(chunks)).decode(), f'id: {self.second.pk + 1}\nevent: message\ndata: {{"live":true}}\n\n')
+        await chunks.aclose()
+
+    async def test_stream_delivers_lower_ids_committed_late_and_replays_them(self):
+        response = await self.async_client.get(
+            f'/projects/{self.project.pk}/stream/', {'since': self.second.pk}, headers={'Authorization': 'Token ' + self.token},
+        )
+        chunks = aiter(response.streaming_content)
+        # the first message was sent within the replay grace before the second
+        self.assertTrue((await anext(chunks)).decode().startswith(f'id: {self.first.pk}\n'))
+        self.assertEqual(await anext(chunks), b': connected\n\n')
+        get_hub().publish(self.project.pk, self.second.pk + 5, '{}')
+        get_hub().publish(self.project.pk, self.second.pk + 4, '{}')
+        self.assertTrue((await anext(chunks)).decode().startswith(f'id: {self.second.pk + 5}\n'))
+        self.assertTrue((await anext(chunks)).decode().startswith(f'id: {self.second.pk + 4}\n'))
+        await chunks.aclose()
+
+    def test_messages_are_not_rendered_without_subscribers(self):
+        with mock.patch('unicollab.signals.MessageSerializer') as serializer, self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.user, content='unheard', project=self.project)
+        serializer.assert_not_called()
+
+    async def test_stream_requires_membership(self):
+        outsider = await User.objects.acreate(username='outsider')
+        token = await Token.objects.acreate(user=outsider)
+        response = await self.async_client.get(f'/projects/{self.project.pk}/stream/', headers={'Authorization': 'Token ' + token.key})
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncViewTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('async', rows=3)
+        self.project = Project.objects.get(title='async-project-0')
+        for i in range(3):
+            Message.objects.create(sender=self.user, content=f'm{i}', project=self.project)
+        self.token = Token.objects.create(user=self.user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    async def get(self, url, params=None, token=None):
+        return await self.async_client.get(url, params or {}, headers={'Authorization': 'Token ' + (token or self.token)})
+
+    async def test_async_lists_match_the_sync_views(self):
+        for sync_url, async_url, params in (
+            ('/messages/', '/async/messages/', {'page_size': 2}),
+            ('/notifications/', '/async/notifications/', {'type': 'update'}),
+            ('/tasks/', '/async/tasks/', {'status': 'to_do', 'project': self.project.pk}),
+            ('/users/me/', '/async/users/me/', {}),
+        ):
+            expected = await sync_to_async(self.client.get)(sync_url, params)
+            response = await self.get(async_url, params)
+            self.assertEqual(response.status_code, 200)
+            # identical apart from the path in the pagination links
+            self.assertEqual(response.content.replace(b'/async/', b'/'), expected.content, async_url)
+
+        page = json.loads((await self.get('/async/messages/', {'page_size': 2})).content)
+        following = json.loads((await self.get(page['next'])).content)
+        self.assertEqual([row['content'] for row in following['results']], ['m2'])
+
+    async def test_authentication_and_parameter_errors(self):
+        self.assertEqual((await self.async_client.get('/async/tasks/')).status_code, 401)
+        self.assertEqual((await self.get('/async/tasks/', {'status': 'bogus'})).status_code, 400)
+        self.assertEqual((await self.get('/async/messages/', {'cursor': 'bogus'})).status_code, 404)
+        self.assertEqual((await self.async_client.post('/async/tasks/', headers={'Authorization': 'Token ' + self.token})).status_code, 405)
+
+
+class BulkTaskTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('bulk', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def payload(self, count):
+        return [
+            {'title': f'bulk {i}', 'description': 'd', 'status': 'to_do', 'priority': 'low',
+             'due_date': str(date.today()), 'project': self.project.title, 'assigned_to': self.user.username}
+            for i in range(count)
+        ]
+
+    def post_counting_queries(self, data):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/tasks/bulk/', data, format='json')
+        return response, len(ctx.captured_queries)
+
+    def test_create_uses_constant_queries(self):
+        small, small_queries = self.post_counting_queries(self.payload(2))
+        large, large_queries = self.post_counting_queries(self.payload(60))
+        self.assertEqual(small.status_code, 201)
+        self.assertEqual(large.status_code, 201)
+        self.assertEqual(len(large.data), 60)
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(Task.objects.filter(title__startswith='bulk ').count(), 62)
+
+    def test_created_tasks_are_searchable_and_synced_without_bulk_insert_ids(self):
+        data = self.payload(3)
+        data[1]['title'] = 'launch checklist'
+        with without_bulk_insert_ids():
+            response = self.client.post('/tasks/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        ids = list(Task.objects.filter(title__in=[item['title'] for item in data]).order_by('id').values_list('id', flat=True))
+        self.assertEqual(len(ids), 3)
+        hits = self.client.get('/search/', {'q': 'checklist'}).data['results']
+        self.assertEqual([(hit['type'], hit['id']) for hit in hits], [('task', ids[1])])
+        self.assertEqual(set(ChangeLogEntry.objects.filter(kind='task', object_id__in=ids).values_list('object_id', flat=True)), set(ids))
+
+    def test_errors_are_reported_per_item_and_nothing_is_written(self):
+        data = self.payload(3)
+        data[1]['project'] = 'missing'
+        data[2]['due_date'] = str(date.today() - timedelta(days=1))
+        response = self.client.post('/tasks/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('project', errors[1])
+        self.assertIn('due_date', errors[2])
+        self.assertFalse(Task.objects.filter(title__startswith='bulk ').exists())
+
+    def test_patch_updates_in_one_statement(self):
+        task = Task.objects.get(project=self.project)
+        response = self.client.patch('/tasks/bulk/', [{'id': task.id, 'status': 'done'}, {'id': 0, 'status': 'done'}], format='json')
+        self.assertEqual(response.data['errors'][1], {'id': ['Task not found.']})
+        response = self.client.patch('/tasks/bulk/', [{'id': True, 'status': 'done'}], format='json')
+        self.assertEqual(response.data['errors'][0], {'id': ['Task not found.']})
+        other = Task.objects.create(
+            title='other', description='d', priority='low', status='to_do', assigned_to=self.user, due_date=date.today(), project=self.project,
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(
+                '/tasks/bulk/', [{'id': task.id, 'status': 'done'}, {'id': other.id, 'status': 'done'}], format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        updates = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE "unicollab_task"')]
+        self.assertEqual(len(updates), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'done')
+
+
+class CachedTokenAuthenticationTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='cached', password='pass12345')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.client.get('/notifications/').status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/notifications/').status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in ctx.captured_queries))
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get('/notifications/')
+        self.assertEqual(self.client.post('/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/notifications/').status_code, 401)
+
+    def test_deactivating_user_invalidates_cached_token(self):
+        self.client.get('/notifications/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/notifications/').status_code, 401)
+
+    def test_cache_holds_no_password_hash(self):
+        self.client.get('/notifications/')
+        cached = caches['auth'].get(token_cache_key(self.token.key))
+        self.assertNotIn(self.user.password, cached)
+        user = CachedTokenAuthentication().authenticate_credentials(self.token.key)[0]
+        self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, 'cached', True))
+        user.first_name = 'Cache'
+        user.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('pass12345'))
+
+    def test_logout_racing_a_cache_miss_leaves_nothing_cached(self):
+        key = self.token.key
+
+        def logout_first(*args, **kwargs):
+            result = real_lookup(*args, **kwargs)
+            self.token.delete()
+            return result
+        real_lookup = TokenAuthentication.authenticate_credentials
+        with mock.patch.object(TokenAuthentication, 'authenticate_credentials', logout_first):
+            CachedTokenAuthentication().authenticate_credentials(key)
+        self.assertIsNone(caches['auth'].get(token_cache_key(key)))
+
+
+class LoginTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='login', email='login@example.com', password='pass12345')
+
+    def login(self, identifier, password='pass12345'):
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as checks, \
+                mock.patch('django.contrib.auth.base_user.make_password', wraps=make_password) as hashes:
+            response = self.client.post('/login/', {'username': identifier, 'password': password})
+        return response, checks.call_count + hashes.call_count
+
+    def test_email_login_hashes_once(self):
+        response, hashed = self.login('login@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hashed, 1)
+
+    def test_unknown_user_still_hashes_once(self):
+        response, hashed = self.login('nobody@example.com')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(hashed, 1)
+
+    def test_username_wins_over_shared_email(self):
+        User.objects.create_user(username='login@example.com', password='other12345')
+        self.assertEqual(self.login('login@example.com', 'other12345')[0].status_code, 200)
+        self.assertEqual(self.login('login@example.com')[0].status_code, 401)
+
+
+class NotificationCounterTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.notifications = [Notification.objects.create(user=self.user, content=str(i), type='update') for i in range(3)]
+
+    def unread(self):
+        return self.client.get('/notifications/unread_count/').data['unread']
+
+    def test_counter_tracks_create_read_and_delete(self):
+        self.assertEqual(self.unread(), 3)
+        self.client.post(f'/notifications/{self.notifications[0].pk}/read/')
+        self.client.post(f'/notifications/{self.notifications[0].pk}/read/')
+        self.assertEqual(self.unread(), 2)
+        self.notifications[1].delete()
+        self.assertEqual(self.unread(), 1)
+        notification = Notification.objects.get(pk=self.notifications[0].pk)
+        notification.is_read = False
+        notification.save()
+        self.assertEqual(self.unread(), 2)
+
+    def test_mark_all_read(self):
+        response = self.client.post('/notifications/mark_all_read/')
+        self.assertEqual(response.data, {'updated': 3})
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_mark_all_read_updates_only_unread_rows_without_an_id_list(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/notifications/mark_all_read/')
+        update, = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "unicollab_notification"')]
+        where = update.split(' WHERE ')[1]
+        self.assertIn('"is_read"', where)
+        self.assertNotIn(' IN (', where)
+        response = self.client.post('/notifications/mark_all_read/')
+        self.assertEqual(response.data, {'updated': 0})
+        self.assertEqual(self.unread(), 0)
+
+    def test_mark_all_read_only_subtracts_what_it_marked(self):
+        # as if the fan-out worker inserted two more after the snapshot
+        NotificationCounter.objects.adjust({self.user.pk: 2})
+        project = Project.objects.create(title='inbox', description='d', created_by=self.user)
+        project.members.add(self.user)
+        before = self.client.get(f'/projects/{project.pk}/members/')
+        self.client.post('/notifications/mark_all_read/')
+        self.assertEqual(self.unread(), 2)
+        after = self.client.get(f'/projects/{project.pk}/members/')
+        self.assertNotEqual(before['ETag'], after['ETag'])
+
+    def test_save_without_is_read_leaves_counter_alone(self):
+        notification = self.notifications[0]
+        notification.is_read = True
+        notification.content = 'edited'
+        notification.save(update_fields=['content'])
+        self.assertEqual(self.unread(), 3)
+        notification.save()
+        self.assertEqual(self.unread(), 2)
+
+    def test_unread_count_is_one_query(self):
+        self.unread()
+        with self.assertNumQueries(1):
+            self.unread()
+
+
+class ReminderTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('planner', rows=0)
+        self.project = Project.objects.create(title='deadlines', description='d', created_by=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def create(self, title, days, status='to_do'):
+        return Task.objects.create(
+            title=title, description='d', priority='low', status=status, assigned_to=self.user,
+            due_date=timezone.localdate() + timedelta(days=days), project=self.project,
+        )
+
+    def send(self, **options):
+        out = io.StringIO()
+        call_command('send_reminders', stdout=out, **options)
+        return out.getvalue().strip()
+
+    def test_reminds_unfinished_tasks_in_window_once(self):
+        today, tomorrow = self.create('ship', 0), self.create('review', 1)
+        self.create('later', 3)
+        self.create('shipped', 0, status='done')
+        self.assertEqual(self.send(), '2 reminders created')
+        self.assertEqual(sorted(Notification.objects.filter(type='reminder').values_list('task_id', 'content')), [
+            (today.pk, 'Reminder: "ship" is due today.'), (tomorrow.pk, 'Reminder: "review" is due tomorrow.'),
+        ])
+        self.assertEqual(self.client.get('/notifications/unread_count/').data['unread'], 2)
+        self.assertEqual(self.send(), '0 reminders created')
+
+        tomorrow.due_date = timezone.localdate()
+        tomorrow.save()
+        self.assertEqual(self.send(days=3), '2 reminders created')
+        self.assertEqual(Notification.objects.filter(task=tomorrow).count(), 2)
+
+    def test_scans_in_keyset_chunks_with_one_query_each(self):
+        for i in range(5):
+            self.create(f'task-{i}', i % 2)
+        Notification.objects.create(
+            user=self.user, type='reminder', content='sent earlier', task=Task.objects.get(title='task-0'), remind_on=timezone.localdate(),
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.send(chunk_size=2), '4 reminders created')
+        scans = [query['sql'] for query in ctx.captured_queries if 'NOT EXISTS' in query['sql'] and 'IN (' not in query['sql']]
+        self.assertEqual(len(scans), 3)
+        self.assertEqual(Notification.objects.filter(type='reminder').count(), 5)
+
+    @override_settings(UNICOLLAB_SYNC_LAG=0)
+    def test_reminders_reach_the_sync_feed(self):
+        task = self.create('ship', 0)
+        cursor = self.client.get('/sync/').data['cursor']
+        with without_bulk_insert_ids():
+            self.assertEqual(self.send(), '1 reminders created')
+        reminder = Notification.objects.get(task=task, type='reminder')
+        changes = self.client.get('/sync/', {'since': cursor}).data['changes']
+        self.assertEqual([(change['type'], change['id'], change['op']) for change in changes], [('notification', reminder.pk, 'upsert')])
+        self.assertEqual(changes[0]['data']['content'], 'Reminder: "ship" is due today.')
+
+    def test_overlapping_runs_create_each_reminder_once(self):
+        for i in range(3):
+            self.create(f'task-{i}', 0)
+        real_remind = reminders.remind
+
+        def overtaken(task_ids, today, end):
+            # another run reminds the same chunk between this run's scan and insert
+            self.assertEqual(real_remind(task_ids, today, end), 3)
+            return real_remind(task_ids, today, end)
+
+        with mock.patch('unicollab.reminders.remind', side_effect=overtaken):
+            self.assertEqual(self.send(), '0 reminders created')
+        self.assertEqual(Notification.objects.filter(type='reminder').count(), 3)
+        self.assertEqual(self.client.get('/notifications/unread_count/').data['unread'], 3)
+
+
+class ScheduleRangeTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('planner', rows=0)
+        self.teammate = make_user_with_rows('teammate', rows=0)
+        self.project = Project.objects.create(title='calendar', description='d', created_by=self.teammate)
+        self.project.members.add(self.user, self.teammate)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.monday = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def event(self, title, start_hours, end_hours, by=None, team=True):
+        return Schedule.objects.create(
+            title=title, start_time=self.monday + timedelta(hours=start_hours), end_time=self.monday + timedelta(hours=end_hours),
+            scheduled_by=by or self.teammate, project=self.project, is_team_event=team,
+        )
+
+    def window(self, start_hours, end_hours, **extra):
+        return {'start': (self.monday + timedelta(hours=start_hours)).isoformat(), 'end': (self.monday + timedelta(hours=end_hours)).isoformat(), **extra}
+
+    def test_calendar_returns_overlapping_project_events(self):
+        self.event('before', 0, 8)
+        self.event('spanning', 7, 11)
+        self.event('inside', 9, 10)
+        self.event('after', 12, 13)
+        response = self.client.get('/schedules/calendar/', self.window(8, 12))
+        self.assertEqual([row['title'] for row in response.data['results']], ['spanning', 'inside'])
+
+    def test_busy_merges_overlapping_events(self):
+        self.event('a', 9, 11)
+        self.event('b', 10, 12)
+        self.event('c', 12, 13, by=self.user, team=False)
+        self.event('private', 15, 16, team=False)
+        self.event('d', 20, 30)
+        response = self.client.get('/schedules/busy/', self.window(0, 24))
+        spans = [(row['start'] - self.monday, row['end'] - self.monday) for row in response.data]
+        self.assertEqual(spans, [(timedelta(hours=9), timedelta(hours=13)), (timedelta(hours=20), timedelta(hours=24))])
+
+    def test_conflicts_and_invalid_window(self):
+        clash = self.event('standup', 9, 10)
+        self.event('solo', 9, 10, team=False)
+        response = self.client.get('/schedules/conflicts/', self.window(9, 9.5, project=self.project.pk))
+        self.assertEqual([row['title'] for row in response.data], ['standup'])
+        response = self.client.get('/schedules/conflicts/', self.window(9, 9.5, project=self.project.pk, exclude=clash.pk))
+        self.assertEqual(response.data, [])
+        self.assertEqual(self.client.get('/schedules/busy/', self.window(5, 4)).status_code, 400)
+
+
+class ResponseCacheTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('cacher', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def test_resource_list_is_cached_and_invalidated(self):
+        first = self.client.get('/resources/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/resources/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        not_modified = self.client.get('/resources/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Resource.objects.create(title='new', file_url='https://example.com/n', uploaded_by=self.user, project=self.project)
+        changed = self.client.get('/resources/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.data['results']), 2)
+
+    def test_resource_list_is_scoped_per_user(self):
+        Resource.objects.filter(uploaded_by=self.user).update(is_public=False)
+        self.assertEqual(len(self.client.get('/resources/').data['results']), 1)
+        self.client.credentials()
+        self.assertEqual(len(self.client.get('/resources/').data['results']), 0)
+
+    def test_members_invalidated_by_membership_and_member_changes(self):
+        url = f'/projects/{self.project.pk}/members/'
+        self.assertEqual(len(self.client.get(url).data), 1)
+        newcomer = make_user_with_rows('newcomer', rows=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.members.add(newcomer)
+        self.assertEqual(len(self.client.get(url).data), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(
+                title='fresh', description='d', priority='low', status='to_do', assigned_to=newcomer,
+                due_date=date.today(), project=self.project,
+            )
+        members = {row['username']: row for row in self.client.get(url).data}
+        self.assertEqual([task['title'] for task in members['newcomer']['tasks']], ['fresh'])
+
+
+    def test_invalidation_is_batched_per_transaction(self):
+        self.client.get('/messages/')  # warm the token and membership caches
+        with mock.patch('unicollab.caching.get_response_cache') as cache, self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as ctx, transaction.atomic():
+                for i in range(3):
+                    Notification.objects.create(user=self.user, content=f'hi {i}', type='update')
+                Resource.objects.create(title='batch', file_url='https://example.com/b', uploaded_by=self.user, project=self.project)
+            cache.return_value.delete_many.assert_not_called()
+        cache.return_value.delete_many.assert_called_once()
+        self.assertLessEqual(
+            {RESOURCES, project_members_key(self.project.pk), project_dashboard_key(self.project.pk)},
+            set(cache.return_value.delete_many.call_args[0][0]),
+        )
+        self.assertFalse(any('unicollab_project_members' in query['sql'] for query in ctx.captured_queries))
+
+
+class MembershipCacheTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user_with_rows('owner', rows=1)
+        self.guest = make_user_with_rows('guest', rows=0)
+        self.project = Project.objects.get(created_by=self.owner)
+        Message.objects.create(sender=self.owner, content='hello', project=self.project)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.guest).key)
+
+    def test_set_is_cached_and_follows_membership_changes(self):
+        self.assertEqual(len(self.client.get('/messages/').data['results']), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/messages/')
+        self.assertFalse(any('unicollab_project_members' in query['sql'] for query in ctx.captured_queries))
+
+        self.project.members.add(self.guest)
+        self.assertEqual(len(self.client.get('/messages/').data['results']), 1)
+        self.guest.project_members.remove(self.project)
+        self.assertEqual(len(self.client.get('/messages/').data['results']), 0)
+        response = self.client.post('/messages/', {'project': self.project.pk, 'content': 'let me in'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_member_changes_are_one_write(self):
+        url = f'/projects/{self.project.pk}/members/'
+        others = [make_user_with_rows(f'joiner{i}', rows=0) for i in range(3)]
+        ids = [self.guest.pk] + [user.pk for user in others]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.owner).key)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'users': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['members'], sorted([self.owner.pk, *ids]))
+        inserts = [query for query in ctx.captured_queries if query['sql'].startswith('INSERT') and '"unicollab_project_members"' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+
+        response = self.client.delete(url, {'users': ids[:2]}, format='json')
+        self.assertEqual(response.data['members'], sorted([self.owner.pk, *ids[2:]]))
+        self.assertEqual(self.client.post(url, {'users': [0]}, format='json').status_code, 400)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=others[-1]).key)
+        self.assertEqual(self.client.post(url, {'users': [self.guest.pk]}, format='json').status_code, 403)
+
+
+class DashboardTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('lead', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        for i, (status, priority) in enumerate([('done', 'high'), ('in_progress', 'high'), ('to_do', 'medium')]):
+            Task.objects.create(
+                title=f'extra-{i}', description='d', priority=priority, status=status, assigned_to=self.user,
+                due_date=date.today() - timedelta(days=i + 1), project=self.project,
+            )
+        for i in range(3):
+            Message.objects.create(sender=self.user, content=f'note {i}', project=self.project)
+        self.url = f'/projects/{self.project.pk}/dashboard/'
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    @override_settings(UNICOLLAB_DASHBOARD_ITEMS=2)
+    def test_aggregates_in_fixed_queries_and_is_cached(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(self.url).data
+        self.assertEqual(len(ctx.captured_queries), 6)
+        self.assertEqual(data['tasks'], {
+            'total': 4, 'overdue': 2,
+            'by_status': {'to_do': 2, 'in_progress': 1, 'done': 1},
+            'by_priority': {'low': 1, 'medium': 1, 'high': 2},
+        })
+        self.assertEqual([task['title'] for task in data['overdue_tasks']], ['extra-2', 'extra-1'])
+        self.assertEqual([message['content'] for message in data['messages']], ['note 2', 'note 1'])
+        self.assertEqual(len(data['resources']), 1)
+        self.assertEqual(len(data['schedules']), 1)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.user, content='note 3', project=self.project)
+        self.assertEqual(self.client.get(self.url).data['messages'][0]['content'], 'note 3')
+
+    def test_requires_visibility(self):
+        stranger = make_user_with_rows('stranger', rows=0)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=stranger).key)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class TaskBoardTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('planner', rows=1)
+        self.other = make_user_with_rows('helper', rows=0)
+        self.project = Project.objects.get(created_by=self.user)
+        self.project.members.add(self.other)
+        self.url = f'/projects/{self.project.pk}/board/'
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def create(self, title, status, user=None, **extra):
+        return Task.objects.create(
+            title=title, description='d', priority='low', status=status, assigned_to=user or self.user,
+            due_date=date.today() + timedelta(days=len(title)), project=self.project, **extra,
+        )
+
+    def counts(self):
+        return dict(self.client.get(self.url).data['counts'])
+
+    def snapshot(self):
+        return sorted(TaskStatusCount.objects.filter(count__gt=0).values_list('project_id', 'status', 'private_to', 'count'))
+
+    def test_board_groups_visible_tasks_in_fixed_queries(self):
+        self.create('write', 'in_progress')
+        self.create('secret', 'done', user=self.other, is_public=False)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(self.url).data
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+        self.assertEqual({status: [task['title'] for task in tasks] for status, tasks in data['columns'].items()}, {
+            'to_do': ['planner-task-0'], 'in_progress': ['write'], 'done': [],
+        })
+        self.assertEqual(data['counts'], {'to_do': 1, 'in_progress': 1, 'done': 0})
+
+    def test_counts_follow_saves_deletes_and_bulk_writes(self):
+        task = self.create('review', 'to_do')
+        self.assertEqual(self.counts()['to_do'], 2)
+        task.status = 'done'
+        task.save()
+        Task.objects.only('id', 'title').get(pk=task.pk).save()
+        self.assertEqual(self.counts(), {'to_do': 1, 'in_progress': 0, 'done': 1})
+        task.delete()
+        self.assertEqual(self.counts()['done'], 0)
+
+        first = Task.objects.get(title='planner-task-0')
+        self.client.patch('/tasks/bulk/', [{'id': first.id, 'status': 'in_progress'}], format='json')
+        self.client.post('/tasks/bulk/', [{
+            'title': 'bulk', 'description': 'd', 'status': 'done', 'priority': 'low',
+            'due_date': str(date.today()), 'project': self.project.title, 'assigned_to': 'planner',
+        }], format='json')
+        self.assertEqual(self.counts(), {'to_do': 0, 'in_progress': 1, 'done': 1})
+
+        incremental = self.snapshot()
+        TaskStatusCount.objects.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+        self.project.delete()
+        self.assertFalse(TaskStatusCount.objects.exists())
+
+
+    def test_counts_move_from_the_stored_row_not_a_stale_copy(self):
+        task = self.create('race', 'to_do')
+        first, second = Task.objects.get(pk=task.pk), Task.objects.get(pk=task.pk)
+        first.status = 'done'
+        first.save()
+        second.status = 'in_progress'
+        second.save()
+        self.assertEqual(self.counts(), {'to_do': 1, 'in_progress': 1, 'done': 0})
+
+        incremental = self.snapshot()
+        TaskStatusCount.objects.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+class ResourceFileTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = make_user_with_rows('uploader', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        self.content = bytes(range(256)) * 1024
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+
+    def upload(self, title='blob'):
+        return self.client.post('/resources/upload/', {
+            'title': title, 'project': self.project.title,
+            'file': SimpleUploadedFile('blob.bin', self.content, content_type='application/octet-stream'),
+        })
+
+    def test_upload_dedups_and_download_supports_ranges(self):
+        first, second = self.upload('first'), self.upload('second')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data['size'], len(self.content))
+        self.assertTrue(first.data['file_url'].endswith(f"/resources/{first.data['id']}/download/"))
+        stored = Resource.objects.filter(pk__in=[first.data['id'], second.data['id']]).values_list('file', flat=True)
+        self.assertEqual(len(set(stored)), 1)
+
+        url = f"/resources/{first.data['id']}/download/"
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+        self.assertEqual(b''.join(partial.streaming_content), self.content[1000:2000])
+        suffix = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-10:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.content)}-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_blob_outlives_only_its_last_resource(self):
+        first, second = self.upload('first'), self.upload('second')
+        name = Resource.objects.get(pk=first.data['id']).file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            Resource.objects.get(pk=first.data['id']).delete()
+        self.assertTrue(get_resource_storage().exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            Resource.objects.get(pk=second.data['id']).delete()
+        self.assertFalse(get_resource_storage().exists(name))
+
+    def test_blob_left_behind_is_reused_under_its_own_name(self):
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        get_resource_storage().save(blob_name(sha256), io.BytesIO(self.content))
+        response = self.upload()
+        self.assertEqual(Resource.objects.get(pk=response.data['id']).file.name, blob_name(sha256))
+        self.assertEqual(get_resource_storage().listdir(f'resources/{sha256[:2]}')[1], [sha256])
+        with self.captureOnCommitCallbacks(execute=True):
+            Resource.objects.get(pk=response.data['id']).delete()
+        self.assertFalse(ResourceBlob.objects.filter(sha256=sha256).exists())
+        self.assertFalse(get_resource_storage().exists(blob_name(sha256)))
+
+    async def test_asgi_download_is_an_async_stream(self):
+        pk = (await sync_to_async(self.upload)()).data['id']
+        token = await sync_to_async(lambda: Token.objects.get(user=self.user).key)()
+        response = await self.async_client.get(
+            f'/resources/{pk}/download/', headers={'Authorization': 'Token ' + token, 'Range': 'bytes=10-'},
+        )
+        self.assertEqual(response.status_code, 206)
+        # a sync iterator would be buffered whole by the ASGI handler
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b''.join(chunks), self.content[10:])
+
+    @override_settings(UNICOLLAB_MAX_UPLOAD_SIZE=1024)
+    def test_rejects_oversized_and_non_member_uploads(self):
+        self.assertEqual(self.upload().status_code, 413)
+        self.assertFalse(Resource.objects.filter(title='blob').exists())
+        with override_settings(UNICOLLAB_MAX_UPLOAD_SIZE=len(self.content)):
+            self.project.members.remove(self.user)
+            self.assertEqual(self.upload().status_code, 400)
+
+
+class MessageArchiveTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('historian', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        now = timezone.now()
+        for i in range(6):
+            message = Message.objects.create(sender=self.user, project=self.project, content=f'message {i} ' * (i * 20 + 1))
+            Message.objects.filter(pk=message.pk).update(timestamp=now - timedelta(days=200 - i))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def history(self, url=None):
+        rows, url = [], url or f'/projects/{self.project.pk}/history/?page_size=4'
+        while url:
+            data = self.client.get(url).data
+            rows += data['results']
+            url = data['next']
+        return rows
+
+    def test_pack_round_trips_and_only_deflates_when_smaller(self):
+        self.assertEqual(pack('hi')[:1], b'\x00')
+        self.assertEqual(pack('hello ' * 50)[:1], b'\x01')
+        self.assertLess(len(pack('hello ' * 50)), 50)
+        for text in ('', 'hi', 'h\u00e9llo ' * 50):
+            self.assertEqual(unpack(pack(text)), text)
+
+    def test_command_moves_old_messages_in_resumable_batches(self):
+        before = self.history()
+        call_command('archive_messages', days=90, batch_size=4, max_batches=1, stdout=io.StringIO())
+        self.assertEqual(ArchivedMessage.objects.count(), 4)
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(self.history(), before)
+
+        out = io.StringIO()
+        call_command('archive_messages', days=90, batch_size=4, stdout=out)
+        self.assertEqual(out.getvalue().strip(), '2 messages archived')
+        self.assertFalse(Message.objects.exists())
+        self.assertEqual(sorted(ArchivedMessage.objects.values_list('id', flat=True)), sorted(row['id'] for row in before))
+        self.assertFalse(ChangeLogEntry.objects.filter(kind='message', deleted=True).exists())
+        self.assertFalse(SearchDocument.objects.filter(kind='message').exists())
+        self.assertEqual(self.history(), before)
+
+    def test_history_merges_tiers_newest_first(self):
+        call_command('archive_messages', days=197, stdout=io.StringIO())
+        recent = Message.objects.create(sender=self.user, project=self.project, content='today')
+        self.assertEqual(ArchivedMessage.objects.count(), 4)
+        rows = self.history()
+        self.assertEqual([row['content'] for row in rows][:2], ['today', 'message 5 ' * 101])
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row['timestamp'], row['id']), reverse=True))
+        self.assertEqual(rows[0], MessageSerializer(recent).data)
+
+        data = self.client.get(f'/projects/{self.project.pk}/history/?page_size=4').data
+        older = self.client.get(data['next']).data
+        newer = self.client.get(older['previous']).data
+        self.assertEqual(newer['results'], data['results'])
+
+    def test_live_page_skips_archive_and_outsiders_see_nothing(self):
+        call_command('archive_messages', days=197, stdout=io.StringIO())
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(f'/projects/{self.project.pk}/history/?page_size=1')
+        self.assertFalse(any('archivedmessage' in query['sql'] for query in ctx.captured_queries))
+
+        outsider = make_user_with_rows('outsider', rows=0)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=outsider).key)
+        self.assertEqual(self.client.get(f'/projects/{self.project.pk}/history/').status_code, 404)
+
+
+class QueryBudgetTests(UnicollabTestCase):
+    def test_every_endpoint_stays_within_its_query_budget(self):
+        user_ids = seed(users=30, projects=6, members=8, tasks=6, messages=6, resources=3, schedules=3, notifications=3)
+        user = User.objects.get(pk=user_ids[0])
+        user.is_staff = True
+        user.save()
+        results = run_load(user, iterations=2, client_class=CommittingAPIClient)
+        self.assertEqual(set(results), set(QUERY_BUDGETS))
+        self.assertEqual({result['route'] for result in results.values()}, route_methods() - UNLOADED_ROUTES)
+        self.assertEqual([name for name, result in results.items() if result['failed']], [])
+        self.assertEqual(over_budget(results), {})
+
+
+class SearchTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('searcher', rows=1)
+        self.other = make_user_with_rows('outsider', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        other_project = Project.objects.get(created_by=self.other)
+        self.message = Message.objects.create(sender=self.user, content='Rocket telemetry is ready', project=self.project)
+        Message.objects.create(sender=self.other, content='rocket gossip', project=other_project)
+        self.task = Task.objects.create(
+            title='Rocket launch', description='countdown', priority='high', status='to_do',
+            assigned_to=self.other, due_date=date.today(), project=other_project,
+        )
+        Task.objects.create(
+            title='Rocket secret', description='d', priority='low', status='to_do',
+            assigned_to=self.other, due_date=date.today(), project=other_project, is_public=False,
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def results(self, query):
+        return [(row['type'], row['id']) for row in self.client.get('/search/', {'q': query}).data['results']]
+
+    def test_ranks_visible_matches_without_like_scans(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/search/', {'q': 'ROCKET'})
+        self.assertEqual(
+            [(row['type'], row['id']) for row in response.data['results']],
+            [('task', self.task.id), ('message', self.message.id)],
+        )
+        self.assertEqual(response.data['results'][0]['object']['title'], 'Rocket launch')
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+        self.assertFalse(any('LIKE' in query['sql'] for query in ctx.captured_queries))
+        self.assertEqual(self.results('rocket countdown'), [('task', self.task.id)])
+        self.assertEqual(self.client.get('/search/', {'q': 'rocket', 'type': 'message'}).data['results'][0]['id'], self.message.id)
+
+    def test_index_follows_updates_deletes_and_bulk_writes(self):
+        self.message.content = 'Payload manifest'
+        self.message.save()
+        self.assertEqual(self.results('telemetry'), [])
+        self.assertEqual(self.results('manifest'), [('message', self.message.id)])
+        self.message.delete()
+        self.assertEqual(self.results('manifest'), [])
+
+        response = self.client.post('/tasks/bulk/', [{
+            'title': 'Orbit insertion', 'description': 'd', 'status': 'to_do', 'priority': 'low',
+            'due_date': str(date.today()), 'project': self.project.title, 'assigned_to': self.user.username,
+        }], format='json')
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get(title='Orbit insertion')
+        self.assertEqual(self.results('orbit'), [('task', task.id)])
+        self.client.patch('/tasks/bulk/', [{'id': task.id, 'title': 'Reentry'}], format='json')
+        self.assertEqual(self.results('orbit'), [])
+        self.assertEqual(self.results('reentry'), [('task', task.id)])
+
+    def test_rebuild_and_empty_query(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(rebuild_index(), {'message': 2, 'task': 4, 'resource': 2})
+        self.assertEqual(self.results('rocket'), [('task', self.task.id), ('message', self.message.id)])
+        self.assertEqual(self.client.get('/search/', {'q': '!'}).data['results'], [])
+        self.assertEqual(self.client.get('/search/').status_code, 400)
+
+    def test_terms_shorter_than_the_fulltext_minimum_are_not_indexed(self):
+        self.assertEqual(tokenize('QA to review the rocket'), ['review', 'the', 'rocket'])
+        self.assertEqual(self.client.get('/search/', {'q': 'is'}).data['results'], [])
+
+
+class ProjectExportTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('exporter', rows=1)
+        self.other = make_user_with_rows('teammate', rows=0)
+        self.project = Project.objects.get(created_by=self.user)
+        self.project.members.add(self.other)
+        for i in range(5):
+            Message.objects.create(sender=self.user, content=f'note {i}', project=self.project)
+        Task.objects.create(
+            title='hidden', description='d', priority='low', status='to_do', assigned_to=self.other,
+            due_date=date.today(), project=self.project, is_public=False,
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def export(self, output):
+        response = self.client.get(f'/projects/{self.project.pk}/export/', {'output': output})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(UNICOLLAB_EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_streams_visible_rows_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response, body = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(rows[0], {'type': 'project', 'id': self.project.pk, 'title': self.project.title, 'description': 'd'})
+        self.assertEqual([row['type'] for row in rows[1:]], ['task'] + ['message'] * 5 + ['resource', 'schedule'])
+        self.assertEqual([row['content'] for row in rows[2:7]], [f'note {i}' for i in range(5)])
+        self.assertEqual(rows[1]['assigned_to'], 'exporter')
+        # one query per chunk of two messages; nothing loads whole tables
+        self.assertEqual(sum('unicollab_message' in query['sql'] for query in ctx.captured_queries), 3)
+
+    def test_csv_shares_one_header(self):
+        response, body = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[0]['type'], 'task')
+        self.assertEqual(rows[0]['due_date'], date.today().isoformat())
+        self.assertEqual(rows[-1]['scheduled_by'], 'exporter')
+        self.assertEqual(self.client.get(f'/projects/{self.project.pk}/export/', {'output': 'xml'}).status_code, 400)
+
+    @override_settings(UNICOLLAB_EXPORT_CHUNK_SIZE=2)
+    async def test_asgi_export_is_an_async_stream(self):
+        _, expected = await sync_to_async(self.export)('csv')
+        response = await self.async_client.get(
+            f'/projects/{self.project.pk}/export/', {'output': 'csv'}, headers={'Authorization': 'Token ' + self.token},
+        )
+        # a sync iterator would be buffered whole by the ASGI handler
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response]
+        # the header, then one per query: 1 task, 5 messages in 3, 1 resource, 1 schedule
+        self.assertEqual(len(chunks), 7)
+        self.assertEqual(b''.join(chunks).decode(), expected)
+
+
+class ValuesListTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('lister', rows=3)
+        project = Project.objects.get(title='lister-project-0')
+        Message.objects.create(sender=self.user, content='caf\u00e9 "quoted"', project=project)
+        Task.objects.filter(title='lister-task-1').update(priority='high', status='in_progress')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def test_lists_render_byte_identical_to_serializers(self):
+        renderer = JSONRenderer()
+        for url, serializer_class, queryset in (
+            ('/tasks/', TaskSerializer, Task.objects.order_by('due_date', 'id')),
+            ('/messages/', MessageSerializer, Message.objects.order_by('timestamp', 'id')),
+            ('/resources/', ResourceSerializer, Resource.objects.order_by('-timestamp', '-id')),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(len(ctx.captured_queries), 1)
+            expected = renderer.render(serializer_class(queryset, many=True).data)
+            self.assertEqual(renderer.render(response.data['results']), expected)
+
+    def test_mapper_rejects_nested_serializers(self):
+        with self.assertRaises(TypeError):
+            values_mapper(UserSerializer)
+
+
+class NotificationFanoutTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('announcer', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        self.members = [make_user_with_rows(f'member{i}', rows=0) for i in range(3)]
+        self.project.members.add(*self.members)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/messages/')  # warm the token and membership caches
+
+    def test_message_notifies_other_members_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Message.objects.create(sender=self.user, content='not yet', project=self.project)
+        self.assertFalse(Notification.objects.filter(type='message').exists())
+        self.assertTrue(callbacks)
+
+        response = self.client.post('/messages/', {'content': 'standup moved', 'project': self.project.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sender'], self.user.pk)
+        notified = Notification.objects.filter(type='message', content='New message: standup moved')
+        self.assertEqual(sorted(notified.values_list('user_id', flat=True)), sorted(member.pk for member in self.members))
+        self.assertEqual(NotificationCounter.objects.unread_for(self.members[0]), 1)
+
+    def test_notifications_reach_the_change_log_without_bulk_insert_ids(self):
+        logged = ChangeLogEntry.objects.filter(kind='notification').exclude(id__in=list(ChangeLogEntry.objects.values_list('id', flat=True)))
+        with without_bulk_insert_ids():
+            self.client.post('/messages/', {'content': 'ids please', 'project': self.project.pk}, format='json')
+        notified = Notification.objects.filter(content='New message: ids please')
+        self.assertEqual(len(notified), 3)
+        self.assertEqual(
+            set(logged.values_list('object_id', 'user_id')),
+            {(notification.pk, notification.user_id) for notification in notified},
+        )
+
+    def test_bulk_reassignment_and_team_events(self):
+        task = Task.objects.get(project=self.project)
+        self.client.patch('/tasks/bulk/', [{'id': task.pk, 'status': 'done'}], format='json')
+        self.client.patch('/tasks/bulk/', [{'id': task.pk, 'assigned_to': 'member0'}], format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(
+                title='retro', start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1),
+                scheduled_by=self.members[1], project=self.project,
+            )
+        self.assertEqual(list(Notification.objects.filter(content__startswith='You were assigned').values_list('user_id', flat=True)), [self.members[0].pk])
+        self.assertEqual(
+            sorted(Notification.objects.filter(type='reminder').values_list('user_id', flat=True)),
+            sorted([self.user.pk, self.members[0].pk, self.members[2].pk]),
+        )
+
+    @override_settings(UNICOLLAB_NOTIFICATION_LINGER=0.5)
+    def test_threaded_pipeline_coalesces_bursts(self):
+        pipeline = ThreadedPipeline()
+        batches = []
+        with mock.patch('unicollab.fanout.deliver', side_effect=lambda events: batches.append(events)):
+            for i in range(3):
+                pipeline.submit(Event('message', self.project.pk, None, f'event {i}', None))
+            pipeline.flush()
+        self.assertEqual([[event.content for event in batch] for batch in batches], [['event 0', 'event 1', 'event 2']])
+
+    @override_settings(UNICOLLAB_NOTIFICATION_LINGER=0.5)
+    def test_threaded_pipeline_retries_a_failed_batch_event_by_event(self):
+        pipeline = ThreadedPipeline()
+        delivered = []
+
+        def deliver(events):
+            if any(event.content == 'bad' for event in events):
+                raise ValueError('bad event')
+            delivered.extend(event.content for event in events)
+
+        with mock.patch('unicollab.fanout.deliver', side_effect=deliver), self.assertLogs('unicollab.fanout') as logs:
+            for content in ('good 0', 'bad', 'good 1'):
+                pipeline.submit(Event('message', self.project.pk, None, content, None))
+            self.assertTrue(pipeline.flush(timeout=5))
+        self.assertEqual(delivered, ['good 0', 'good 1'])
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'ERROR'])
+        self.assertIn("content='bad'", logs.output[-1])
+
+    def test_threaded_pipeline_delivers_queued_events_at_exit(self):
+        pipeline = ThreadedPipeline()
+        delivered = []
+        with mock.patch('unicollab.fanout.deliver', side_effect=lambda events: (time.sleep(0.2), delivered.extend(events))):
+            pipeline.submit(Event('message', self.project.pk, None, 'late', None))
+            pipeline.shutdown()
+        self.assertEqual([event.content for event in delivered], ['late'])
+
+        stuck = ThreadedPipeline()
+        stuck.queue.put(Event('message', self.project.pk, None, 'no worker', None))
+        with override_settings(UNICOLLAB_NOTIFICATION_SHUTDOWN_TIMEOUT=0.01), self.assertLogs('unicollab.fanout', 'ERROR'):
+            stuck.shutdown()
+        stuck.queue.get()
+        stuck.queue.task_done()  # or its exit hook would wait again
+
+    def test_assigning_a_task_to_yourself_does_not_notify_you(self):
+        task = Task.objects.get(project=self.project)
+        self.client.patch(f'/tasks/{task.pk}/', {'assigned_to': 'member0'}, format='json')
+        self.client.patch(f'/tasks/{task.pk}/', {'assigned_to': 'announcer'}, format='json')
+        self.client.post(f'/tasks/{task.pk}/assign/', {'user_id': self.members[1].pk}, format='json')
+        self.client.post(f'/tasks/{task.pk}/assign/', {'user_id': self.user.pk}, format='json')
+        self.client.post('/tasks/', {
+            'title': 'mine', 'description': 'd', 'status': 'to_do', 'priority': 'low', 'due_date': str(date.today()),
+            'project': self.project.title, 'assigned_to': 'announcer',
+        }, format='json')
+        self.assertEqual(
+            list(Notification.objects.filter(content__startswith='You were assigned').order_by('id').values_list('user_id', flat=True)),
+            [self.members[0].pk, self.members[1].pk],
+        )
+
+
+# entries are read back within the same second they are written
+@override_settings(UNICOLLAB_SYNC_LAG=0)
+class SyncTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user_with_rows('mobile', rows=1)
+        self.other = make_user_with_rows('colleague', rows=1)
+        self.project = Project.objects.get(created_by=self.user)
+        self.project.members.add(self.other)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.cursor = self.client.get('/sync/').data['cursor']
+
+    def sync(self, **params):
+        response = self.client.get('/sync/', {'since': self.cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        self.cursor = response.data['cursor']
+        return [(change['type'], change['id'], change['op']) for change in response.data['changes']]
+
+    def test_returns_only_visible_changes_since_cursor(self):
+        message = Message.objects.create(sender=self.other, content='hello', project=self.project)
+        private = Task.objects.create(
+            title='private', description='d', priority='low', status='to_do', assigned_to=self.other,
+            due_date=date.today(), project=self.project, is_public=False,
+        )
+        Notification.objects.create(user=self.other, content='not yours', type='update')
+        self.assertEqual(self.sync(), [('message', message.id, 'upsert')])
+        self.assertEqual(self.sync(), [])
+
+        private.is_public = True
+        private.save()
+        message_id = message.id
+        message.delete()
+        self.assertEqual(self.sync(), [('task', private.id, 'upsert'), ('message', message_id, 'delete')])
+
+        private.is_public = False
+        private.save()
+        self.assertEqual(self.sync(), [('task', private.id, 'delete')])
+
+    def test_membership_and_bulk_writes(self):
+        other_project = Project.objects.get(created_by=self.other)
+        other_project.members.add(self.user)
+        self.client.post('/notifications/mark_all_read/')
+        changes = self.sync()
+        self.assertEqual(changes[0], ('project', other_project.id, 'upsert'))
+        self.assertEqual({change[0] for change in changes[1:]}, {'notification'})
+
+        other_project.members.remove(self.user)
+        self.assertEqual(self.sync(), [('project', other_project.id, 'delete')])
+
+        task = Task.objects.get(project=self.project, assigned_to=self.user)
+        self.client.patch('/tasks/bulk/', [{'id': task.id, 'assigned_to': 'colleague', 'is_public': False}], format='json')
+        self.assertEqual(self.sync(), [('task', task.id, 'delete')])
+
+    @override_settings(UNICOLLAB_SYNC_BATCH=2)
+    def test_batches_are_bounded(self):
+        messages = [Message.objects.create(sender=self.user, content=str(i), project=self.project) for i in range(3)]
+        response = self.client.get('/sync/', {'since': self.cursor})
+        self.assertTrue(response.data['more'])
+        self.assertEqual([change['id'] for change in response.data['changes']], [messages[0].id, messages[1].id])
+        self.assertEqual(response.data['changes'][0]['data']['content'], '0')
+        self.cursor = response.data['cursor']
+        self.assertEqual(self.sync(), [('message', messages[2].id, 'upsert')])
+        self.assertEqual(self.client.get('/sync/', {'since': 'x'}).status_code, 400)
+
+    def test_updates_tombstone_the_loaded_audience_without_reading_it_back(self):
+        resource = Resource.objects.get(project=self.project, uploaded_by=self.user)
+        resource.uploaded_by = self.other
+        resource.is_public = False
+        with CaptureQueriesContext(connection) as ctx:
+            resource.save()
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'FROM "unicollab_resource"' in q['sql']])
+        self.assertEqual(self.sync(), [('resource', resource.id, 'delete')])
+
+        resource.is_public = True
+        resource.save()
+        self.assertEqual(self.sync(), [('resource', resource.id, 'upsert')])
+
+    def test_unsaved_rows_are_refused_not_dropped(self):
+        with self.assertRaises(ValueError):
+            record_changes([Notification(user=self.user, content='no id', type='update')])
+
+    @override_settings(UNICOLLAB_SYNC_LAG=60)
+    def test_cursor_stays_behind_entries_that_may_still_have_gaps_below(self):
+        start = self.cursor
+        message = Message.objects.create(sender=self.other, content='late', project=self.project)
+        self.assertEqual(self.sync(), [('message', message.id, 'upsert')])
+        self.assertEqual(self.cursor, start)
+        self.assertEqual(self.sync(), [('message', message.id, 'upsert')])
+
+        ChangeLogEntry.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(self.sync(), [('message', message.id, 'upsert')])
+        self.assertGreater(self.cursor, start)
+        self.assertEqual(self.sync(), [])
+
+    def test_pruned_cursors_expire(self):
+        messages = [Message.objects.create(sender=self.user, content=str(i), project=self.project) for i in range(3)]
+        old = ChangeLogEntry.objects.update(created_at=timezone.now() - timedelta(days=40))
+        Message.objects.create(sender=self.user, content='new', project=self.project)
+        self.assertEqual(prune_change_log(timezone.now() - timedelta(days=30), batch_size=1), old - 1)
+        self.assertEqual(ChangeLogEntry.objects.order_by('id').first().object_id, messages[2].id)
+
+        self.assertEqual(self.client.get('/sync/', {'since': self.cursor}).status_code, 410)
+        self.cursor = self.client.get('/sync/').data['cursor']
+        self.assertEqual(self.sync(), [])
+
+
+@override_settings(UNICOLLAB_READ_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(APITransactionTestCase):
+    # replica1/2 mirror the default test database over their own connections,
+    # so the rows have to be committed for them to see anything
+    databases = {'default', 'replica1', 'replica2'}
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.user = make_user_with_rows('reader', rows=2)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        self.client.get('/users/me/')  # warm the token cache
+
+    def queries_by_alias(self, method, url, data=None, patches=()):
+        with ExitStack() as stack:
+            captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in self.databases}
+            for patch in patches:
+                stack.enter_context(patch)
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        return {alias: len(ctx.captured_queries) for alias, ctx in captured.items()}
+
+    def test_safe_reads_go_to_a_replica_until_a_write_pins_the_user(self):
+        counts = self.queries_by_alias('get', '/tasks/')
+        self.assertEqual(counts['default'], 0)
+        self.assertEqual(counts['replica1'] + counts['replica2'], 1)
+
+        counts = self.queries_by_alias('post', '/projects/', {'title': 'new', 'description': 'd'})
+        self.assertEqual(counts['replica1'] + counts['replica2'], 0)
+        counts = self.queries_by_alias('get', '/projects/')
+        self.assertEqual(counts['replica1'] + counts['replica2'], 0)
+        self.assertGreater(counts['default'], 0)
+
+    def test_membership_sets_are_read_from_the_primary(self):
+        forget_memberships(self.user.pk)
+        counts = self.queries_by_alias('get', '/messages/')
+        self.assertEqual(counts['default'], 1)
+        self.assertEqual(counts['replica1'] + counts['replica2'], 1)
+
+        expected = set(Project.objects.filter(members=self.user).values_list('id', flat=True))
+        forget_memberships(self.user.pk)
+        with ExitStack() as stack:
+            captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in self.databases}
+            self.assertEqual(projects_of([self.user.pk]), expected)
+        self.assertEqual([len(captured[alias]) for alias in ('default', 'replica1', 'replica2')], [1, 0, 0])
+
+    def test_unreachable_replica_is_skipped(self):
+        with mock.patch.dict(routers._down_until, clear=True), self.assertLogs('unicollab.routers', 'WARNING'):
+            counts = self.queries_by_alias('get', '/tasks/', patches=[
+                mock.patch.object(connections['replica1'], 'ensure_connection', side_effect=OperationalError('down')),
+                mock.patch('unicollab.routers.random.shuffle', side_effect=lambda aliases: aliases.sort()),
+            ])
+            self.assertEqual((counts['replica1'], counts['replica2']), (0, 1))
+            self.assertIn('replica1', routers._down_until)
+
+
+class ProfilingTests(UnicollabTestCase):
+    def setUp(self):
+        super().setUp()
+        REQUEST_HISTOGRAM.reset()
+        self.staff = make_user_with_rows('profiled', rows=2, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.staff).key)
+
+    def test_unsampled_requests_are_untouched(self):
+        self.assertNotIn('Server-Timing', self.client.get('/tasks/'))
+
+    @override_settings(UNICOLLAB_PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_timing_and_metrics(self):
+        response = self.client.get('/tasks/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", ser;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$')
+        metrics = self.client.get('/metrics/').content.decode()
+        self.assertIn('unicollab_request_duration_seconds_count{view="TaskViewSet",action="list"} 1', metrics)
+        self.assertIn('unicollab_request_duration_seconds_bucket{view="TaskViewSet",action="list",le="+Inf"} 1', metrics)
+
+    @override_settings(UNICOLLAB_PROFILING_SAMPLE_RATE=1.0)
+    def test_serializer_time_is_reported_apart_from_render(self):
+        to_representation = UserSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.02)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(UserSerializer, 'to_representation', slow):
+            response = self.client.get('/users/me/')
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertGreaterEqual(float(timings['ser']), 20)
+        self.assertLess(float(timings['render']), 20)
+
+    def test_repeated_queries_are_flagged(self):
+        make_user_with_rows('second', rows=1)
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile.record_query):
+            for user in User.objects.all():
+                list(user.assigned_tasks.all())
+        self.assertEqual(profile.queries, User.objects.count() + 1)
+        (sql, count), = profile.duplicates(threshold=2).items()
+        self.assertIn('unicollab_task', sql)
+        self.assertIn('dup;desc="1 repeated queries"', profile.server_timing(0.01, {sql: 1}))
+
+    def test_metrics_require_staff(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
@@ -1,7 +1,10 @@
 # urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import  RegisterView, LoginView, LogoutView,UserViewSet, ProjectViewSet, TaskViewSet,ScheduleViewSet, ResourceViewSet, NotificationViewSet,MessageViewSet
+from .views import (
+    RegisterView, LoginView, LogoutView,UserViewSet, ProjectViewSet, TaskViewSet,ScheduleViewSet, ResourceViewSet, NotificationViewSet,MessageViewSet, SearchView, SyncView, MetricsView, project_message_stream,
+    async_message_list, async_notification_list, async_task_list, async_user_me,
+)
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
@@ -16,6 +19,14 @@ urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("login/", LoginView.as_view(), name="login"),
     path("logout/", LogoutView.as_view(), name="logout"),
+    path("projects/<int:pk>/stream/", project_message_stream, name="project-stream"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("search/", SearchView.as_view(), name="search"),
+    path("sync/", SyncView.as_view(), name="sync"),
+    path("async/messages/", async_message_list, name="async-message-list"),
+    path("async/notifications/", async_notification_list, name="async-notification-list"),
+    path("async/tasks/", async_task_list, name="async-task-list"),
+    path("async/users/me/", async_user_me, name="async-user-me"),
 
     path("", include(router.urls)),
 ]
\ No newline at end of file
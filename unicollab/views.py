@@ -1,19 +1,47 @@
+from functools import wraps
+
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
 from django_filters import rest_framework as filters
 from rest_framework import viewsets, status
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import get_user_model
-from .models import User, Project, Task, Resource, Message, Notification, Schedule
+from .models import User, Project, Task, Resource, Message, Notification, NotificationCounter, Schedule, TaskStatusCount, bulk_create_with_pks
 from .serializers import (
     UserSerializer, ProjectSerializer, TaskSerializer,
-    ResourceSerializer, MessageSerializer, NotificationSerializer,
-    ScheduleSerializer, RegisterSerializer
+    ResourceSerializer, ResourceUploadSerializer, MessageSerializer, NotificationSerializer,
+    ScheduleSerializer, ScheduleRangeSerializer, ScheduleConflictSerializer, MembershipChangeSerializer, RegisterSerializer, SearchQuerySerializer,
+    TaskFilterSerializer, NotificationFilterSerializer,
+    render_by_id, resolve_slugs, values_mapper
 )
+from .scheduling import busy_timeline, overlapping
+from .archive import HistoryPagination, message_history
+from .authentication import CachedTokenAuthentication, aauthenticate_token
+from .board import count_moves, lock_stored_keys, task_board
+from .dashboard import project_dashboard
+from .exports import EXPORT_FORMATS, aiterate
+from .files import HashingUploadHandler, file_response, store
+from .fanout import acting_as, assignment_event, submit_on_commit
+from .caching import RESOURCES, bump, bump_member_lists, cached_response, project_dashboard_key, project_members_key
+from .pagination import KeysetPagination
+from .profiling import REQUEST_HISTOGRAM, ProfiledJSONRenderer, ProfiledSerializerMixin, serializing
+from .routers import ReplicaReadMixin
+from .search import index_objects, search
+from .sync import VISIBLE_ROWS, ExpiredCursor, changes_since, head, record_changes
+from .streaming import message_events
+from .visibility import amember_project_ids, visible_projects, visible_tasks, visible_resources, visible_messages, visible_schedules
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
@@ -35,15 +63,8 @@ class LoginView(APIView):
     def post(self, request):
         username_or_email = request.data.get("username") 
         password = request.data.get("password")
-        user = authenticate(username=username_or_email, password=password)
+        user = authenticate(request, username=username_or_email, password=password)
 
-        if not user:
-            try:
-                User = get_user_model()
-                user_obj = User.objects.get(email=username_or_email)
-                user = authenticate(username=user_obj.username, password=password)
-            except User.DoesNotExist:
-                user = None
         if not user:
             return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -65,49 +86,220 @@ class LogoutView(APIView):
         return Response({"success": "Logged out successfully"}, status=status.HTTP_200_OK)
 
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class ValuesListMixin:
+    """List from `values()` rows rendered by the serializer's ValuesMapper
+    instead of building a model instance and serializer per row."""
+
+    def list(self, request, *args, **kwargs):
+        mapper = values_mapper(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is None:
+            with serializing():
+                rows = mapper.render(mapper.values(queryset))
+            return Response(rows)
+        ordering = [field.lstrip('-') for field in self.paginator.get_ordering(self)]
+        page = self.paginate_queryset(mapper.values(queryset, *ordering))
+        with serializing():
+            rows = mapper.render(page)
+        return self.get_paginated_response(rows)
+
+
+class UserViewSet(ProfiledSerializerMixin, ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    ordering = ('id',)
 
     def get_queryset(self):
         if self.request.user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
+            queryset = User.objects.all()
+        else:
+            queryset = User.objects.filter(id=self.request.user.id)
+        return UserSerializer.setup_eager_loading(queryset)
 
     @action(detail=False, methods=["get"])
     def me(self, request):
-        serializer = self.get_serializer(request.user)
+        user = UserSerializer.setup_eager_loading(User.objects.filter(id=request.user.id)).get()
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
-class ProjectViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class ProjectViewSet(ProfiledSerializerMixin, ReplicaReadMixin, viewsets.ModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = ProjectSerializer
+    ordering = ('id',)
 
     def get_queryset(self):
-        return Project.objects.filter(members=self.request.user) | Project.objects.filter(created_by=self.request.user)
+        if self.action in ('export', 'dashboard', 'board', 'history'):
+            return visible_projects(self.request.user)
+        return visible_projects(self.request.user).prefetch_related('members')
 
     def perform_create(self, serializer):
         project = serializer.save(created_by=self.request.user)
         project.members.add(self.request.user)
 
     @action(detail=True, methods=['get'])
+    @cached_response(lambda view, request, pk: [project_members_key(pk)])
     def members(self, request, pk=None):
         project = self.get_object()
-        serializer = UserSerializer(project.members.all(), many=True)
-        return Response(serializer.data)
+        serializer = UserSerializer(UserSerializer.setup_eager_loading(project.members.all()), many=True)
+        with serializing():
+            data = serializer.data
+        return Response(data)
+
+    @members.mapping.post
+    def add_members(self, request, pk=None):
+        return self.change_members(request, add=True)
+
+    @members.mapping.delete
+    def remove_members(self, request, pk=None):
+        return self.change_members(request, add=False)
+
+    def change_members(self, request, add):
+        project = self.get_object()
+        if project.created_by_id != request.user.pk:
+            return Response({"detail": "Only the project creator can change its members."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = MembershipChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        users = serializer.validated_data['users']
+        # one INSERT or DELETE on the through table; the m2m_changed signals
+        # drop the cached membership sets and member lists
+        if add:
+            project.members.add(*users)
+        else:
+            project.members.remove(*users)
+        return Response({"members": sorted(project.members.values_list('id', flat=True))})
 
-class TaskViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+    @action(detail=True, methods=['get'])
+    @cached_response(lambda view, request, pk: [project_dashboard_key(pk)], timeout_setting='UNICOLLAB_DASHBOARD_CACHE_TTL')
+    def dashboard(self, request, pk=None):
+        project = self.get_object()
+        return Response({"project": project.pk, **project_dashboard(request.user, project.pk)})
+
+    @action(detail=True, methods=['get'])
+    def board(self, request, pk=None):
+        project = self.get_object()
+        return Response({"project": project.pk, **task_board(request.user, project.pk)})
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        project = self.get_object()
+        paginator = HistoryPagination()
+        return paginator.get_paginated_response(message_history(paginator, request, project.pk))
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        # ?format= is taken by DRF's format suffix override
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response({"output": f"Choose one of: {', '.join(EXPORT_FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        project = self.get_object()
+        export, content_type = EXPORT_FORMATS[output]
+        body = export(request.user, project)
+        if isinstance(request._request, ASGIRequest):
+            body = aiterate(body)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="project-{project.pk}.{output}"'
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+def bulk_item_id(item):
+    # JSON true/false are bools, which are ints in Python
+    if isinstance(item, dict) and isinstance(item.get('id'), int) and not isinstance(item['id'], bool):
+        return item['id']
+    return None
+
+
+class TaskViewSet(ProfiledSerializerMixin, ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = TaskSerializer
+    ordering = ('due_date', 'id')
     filter_backends = [filters.DjangoFilterBackend]
-    filterset_fields = ('status', 'priority')
+    filterset_fields = ('project', 'status', 'priority')
 
     def get_queryset(self):
-        return Task.objects.filter(assigned_to=self.request.user) | Task.objects.filter(is_public=True)
+        return visible_tasks(self.request.user).select_related('project', 'assigned_to')
+
+    def perform_create(self, serializer):
+        with acting_as(self.request.user.pk):
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with acting_as(self.request.user.pk):
+            serializer.save()
+
+    @action(methods=['post', 'patch'], detail=False)
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a list of tasks."}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = getattr(settings, 'UNICOLLAB_BULK_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            return Response({"detail": f"At most {max_items} tasks per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        partial = request.method == 'PATCH'
+        instances = {}
+        if partial:
+            ids = {bulk_item_id(item) for item in items} - {None}
+            instances = self.get_queryset().select_related('project', 'assigned_to').in_bulk(ids)
+
+        context = self.get_serializer_context()
+        context['slug_cache'] = resolve_slugs(TaskSerializer, items)
+        pending, errors = [], []
+        for item in items:
+            instance = None
+            if partial:
+                instance = instances.get(bulk_item_id(item))
+                if instance is None:
+                    errors.append({"id": ["Task not found."]})
+                    continue
+            serializer = TaskSerializer(instance, data=item, partial=partial, context=context)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+            pending.append(serializer)
+        if any(errors):
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # counts and tombstones move from the rows as stored now, not as
+            # they were read for validation
+            stored = lock_stored_keys(instances) if instances else {}
+            board_keys = {pk: key for pk, (key, _) in stored.items()}
+            previous = {pk: stored_audience for pk, (_, stored_audience) in stored.items()}
+            if partial:
+                tasks, fields = [], set()
+                for serializer in pending:
+                    for attr, value in serializer.validated_data.items():
+                        setattr(serializer.instance, attr, value)
+                    fields.update(serializer.validated_data)
+                    tasks.append(serializer.instance)
+                if fields:
+                    Task.objects.bulk_update(tasks, sorted(fields), batch_size=500)
+            else:
+                # indexing, the change log and the response need the ids
+                tasks = bulk_create_with_pks(
+                    Task, [Task(**serializer.validated_data) for serializer in pending],
+                    key=('project', 'title', 'assigned_to', 'due_date'),
+                )
+            # bulk writes bypass the model signals
+            bump_member_lists(*{task.assigned_to_id for task in tasks})
+            TaskStatusCount.objects.adjust(count_moves(
+                (board_keys.get(task.pk), TaskStatusCount.key_for(task)) for task in tasks
+            ))
+            project_ids = {task.project_id for task in tasks} | {project_id for project_id, _, _ in previous.values()}
+            bump(*(project_dashboard_key(project_id) for project_id in project_ids))
+            if not partial or fields & {'title', 'description', 'project'}:
+                index_objects(tasks)
+            record_changes(tasks, previous=previous)
+            submit_on_commit(*(
+                assignment_event(task, request.user.id) for task in tasks
+                if not partial or task.assigned_to_id != task._loaded_assigned_to_id
+            ))
+        with serializing():
+            data = TaskSerializer(tasks, many=True).data
+        return Response(data, status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED)
 
     @action(methods=['post'], detail=True)
     def assign(self, request, pk=None):
@@ -116,43 +308,313 @@ class TaskViewSet(viewsets.ModelViewSet):
 
         try:
             user = User.objects.get(pk=user_id)
-            task.assigned_to.add(user)
+            task.assigned_to = user
+            with acting_as(request.user.pk):
+                task.save()
             return Response({"success": f"{task.title} assigned to {user.username}"})
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=404)
 
-class ScheduleViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+class ScheduleViewSet(ProfiledSerializerMixin, ReplicaReadMixin, viewsets.ModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = ScheduleSerializer
+    ordering = ('start_time', 'id')
 
     def get_queryset(self):
-        return Schedule.objects.filter(scheduled_by=self.request.user)
+        if self.action in ('calendar', 'busy', 'conflicts'):
+            queryset = visible_schedules(self.request.user)
+        else:
+            queryset = Schedule.objects.filter(scheduled_by=self.request.user)
+        if self.action in ('list', 'calendar'):
+            queryset = queryset.select_related('project', 'scheduled_by')
+            if {'start', 'end'} <= set(self.request.query_params):
+                window = self.get_window()
+                queryset = overlapping(queryset, window['start'], window['end'])
+        return queryset
 
-class ResourceViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+    def get_window(self, serializer_class=ScheduleRangeSerializer):
+        serializer = serializer_class(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        self.get_window()
+        return self.list(request)
+
+    @action(detail=False, methods=['get'])
+    def busy(self, request):
+        window = self.get_window()
+        queryset = self.get_queryset().filter(Q(scheduled_by=request.user) | Q(is_team_event=True))
+        return Response(busy_timeline(queryset, window['start'], window['end']))
+
+    @action(detail=False, methods=['get'])
+    def conflicts(self, request):
+        window = self.get_window(ScheduleConflictSerializer)
+        queryset = self.get_queryset().filter(project_id=window['project'], is_team_event=True)
+        if 'exclude' in window:
+            queryset = queryset.exclude(pk=window['exclude'])
+        serializer = self.get_serializer(
+            overlapping(queryset, window['start'], window['end']).select_related('project', 'scheduled_by').order_by('start_time', 'id'),
+            many=True,
+        )
+        return Response(serializer.data)
+
+class ResourceViewSet(ProfiledSerializerMixin, ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
     serializer_class = ResourceSerializer
+    ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return Resource.objects.filter(is_public=True) | Resource.objects.filter(uploaded_by=self.request.user)
-        return Resource.objects.filter(is_public=True)
+        return visible_resources(self.request.user).select_related('project', 'uploaded_by')
+
+    @cached_response(lambda view, request: [RESOURCES])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
-class NotificationViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def upload(self, request):
+        # must be installed before request.data is first read
+        handler = HashingUploadHandler(request)
+        request.upload_handlers = [handler]
+        serializer = ResourceUploadSerializer(data=request.data, context=self.get_serializer_context())
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            if getattr(handler, 'too_large', False):
+                limit = getattr(settings, 'UNICOLLAB_MAX_UPLOAD_SIZE', 100 * 1024 * 1024)
+                return Response({"file": [f"Files are limited to {limit} bytes."]}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            return Response({"file": ["No file was submitted."]}, status=status.HTTP_400_BAD_REQUEST)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            resource = serializer.save(
+                uploaded_by=request.user, file=store(uploaded), sha256=uploaded.sha256, size=uploaded.size,
+                content_type=uploaded.content_type or '',
+            )
+            resource.file_url = request.build_absolute_uri(reverse('resource-download', args=[resource.pk]))
+            resource.save(update_fields=['file_url'])
+        with serializing():
+            data = ResourceSerializer(resource).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        resource = self.get_object()
+        if not resource.file:
+            return Response({"detail": "This resource has no uploaded file."}, status=status.HTTP_404_NOT_FOUND)
+        if f'"{resource.sha256}"' in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': f'"{resource.sha256}"'})
+        return file_response(resource, request.headers.get('Range'), asynchronous=isinstance(request._request, ASGIRequest))
+
+class NotificationViewSet(ProfiledSerializerMixin, ReplicaReadMixin, viewsets.ModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
     serializer_class = NotificationSerializer
+    ordering = ('-id',)
     filter_backends = [filters.DjangoFilterBackend]
     filterset_fields = ['type']
 
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user)
 
-class MessageViewSet(viewsets.ModelViewSet):
-    authentication_classes = [TokenAuthentication]
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({"unread": NotificationCounter.objects.unread_for(request.user)})
+
+    @action(detail=False, methods=['post'])
+    def mark_all_read(self, request):
+        with transaction.atomic():
+            unread = Notification.objects.filter(user=request.user, is_read=False)
+            # the change log needs the ids; locking them keeps a concurrent
+            # mark_all_read or read from flipping (and uncounting) them twice
+            ids = list(unread.select_for_update().order_by('id').values_list('id', flat=True))
+            # rows the fan-out worker inserts meanwhile sort after the lock and
+            # stay unread until the next call
+            updated = unread.filter(id__lte=ids[-1]).update(is_read=True) if ids else 0
+            NotificationCounter.objects.adjust({request.user.pk: -updated})
+            record_changes(Notification(id=pk, user_id=request.user.pk) for pk in ids)
+            # queryset updates bypass the model signals
+            bump_member_lists(request.user.pk)
+        return Response({"updated": updated})
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        notification = self.get_object()
+        if not notification.is_read:
+            notification.is_read = True
+            notification.save(update_fields=['is_read'])
+        return Response(self.get_serializer(notification).data)
+
+class MessageViewSet(ProfiledSerializerMixin, ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
     serializer_class = MessageSerializer
+    ordering = ('timestamp', 'id')
 
     def get_queryset(self):
-        return Message.objects.filter(project__members=self.request.user) | Message.objects.filter(sender=self.request.user)
+        return visible_messages(self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(sender=self.request.user)
+
+
+class SearchView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    result_serializers = {'message': MessageSerializer, 'task': TaskSerializer, 'resource': ResourceSerializer}
+
+    def get(self, request):
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        kind = params.validated_data.get('type')
+        hits = search(
+            request.user, params.validated_data['q'], [kind] if kind else None,
+            KeysetPagination().get_page_size(request),
+        )
+
+        ids = {}
+        for kind, object_id, _ in hits:
+            ids.setdefault(kind, []).append(object_id)
+        objects = {}
+        for kind, object_ids in ids.items():
+            serializer_class = self.result_serializers[kind]
+            rendered = render_by_id(serializer_class, serializer_class.Meta.model.objects.all(), object_ids)
+            objects.update(((kind, pk), data) for pk, data in rendered.items())
+        return Response({"results": [
+            {"type": kind, "id": object_id, "score": float(score), "object": objects[kind, object_id]}
+            for kind, object_id, score in hits if (kind, object_id) in objects
+        ]})
+
+
+class SyncView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    change_serializers = {
+        'project': ProjectSerializer, 'task': TaskSerializer, 'message': MessageSerializer,
+        'resource': ResourceSerializer, 'schedule': ScheduleSerializer, 'notification': NotificationSerializer,
+    }
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({"cursor": head(), "more": False, "changes": []})
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({"since": "Must be a cursor returned by /sync/."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cursor, more, changes = changes_since(request.user, since)
+        except ExpiredCursor:
+            return Response({"since": "This cursor is older than the change log; sync again from scratch."}, status=status.HTTP_410_GONE)
+        ids = {}
+        for kind, object_id, deleted in changes:
+            if not deleted:
+                ids.setdefault(kind, []).append(object_id)
+        rendered = {}
+        for kind, object_ids in ids.items():
+            rows = render_by_id(self.change_serializers[kind], VISIBLE_ROWS[kind](request.user), object_ids)
+            rendered.update(((kind, pk), data) for pk, data in rows.items())
+        # an upsert the user can no longer see is a delete from their point of view
+        return Response({"cursor": cursor, "more": more, "changes": [
+            {"type": kind, "id": object_id, "op": "upsert", "data": rendered[kind, object_id]}
+            if (kind, object_id) in rendered else {"type": kind, "id": object_id, "op": "delete"}
+            for kind, object_id, _ in changes
+        ]})
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(REQUEST_HISTOGRAM.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+async def project_message_stream(request, pk):
+    user = await aauthenticate_token(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    await amember_project_ids(user)
+    if not await visible_projects(user).filter(pk=pk).aexists():
+        return JsonResponse({"detail": "No Project matches the given query."}, status=404)
+
+    since = request.GET.get("since", request.headers.get("Last-Event-ID"))
+    try:
+        since = int(since) if since is not None else None
+    except ValueError:
+        return JsonResponse({"since": "Must be a message id."}, status=400)
+
+    response = StreamingHttpResponse(message_events(pk, since), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def async_api_view(view):
+    """
+    Run a read-only endpoint as a native async view: token authentication via
+    the async cache and ORM, IsAuthenticated, and the returned data rendered
+    by the DRF views' JSON renderer so responses match them byte for byte.
+    Reads go to default; replica routing needs the sync request path.
+    """
+    @require_GET
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aauthenticate_token(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        request.user = user
+        request.query_params = request.GET
+        try:
+            data = await view(request, *args, **kwargs)
+        except APIException as exc:
+            return JsonResponse(exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}, status=exc.status_code)
+        return HttpResponse(ProfiledJSONRenderer().render(data), content_type='application/json')
+    return wrapper
+
+
+def validated_params(serializer_class, request):
+    serializer = serializer_class(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+async def list_values(request, viewset, queryset):
+    """One keyset page of `queryset` rendered like `viewset`'s list."""
+    mapper = values_mapper(viewset.serializer_class)
+    paginator = KeysetPagination()
+    ordering = [field.lstrip('-') for field in paginator.get_ordering(viewset)]
+    page = await paginator.apaginate_queryset(mapper.values(queryset, *ordering), request, viewset)
+    return paginator.get_paginated_data(mapper.render(page))
+
+
+@async_api_view
+async def async_message_list(request):
+    await amember_project_ids(request.user)
+    return await list_values(request, MessageViewSet, visible_messages(request.user))
+
+
+@async_api_view
+async def async_notification_list(request):
+    params = validated_params(NotificationFilterSerializer, request)
+    return await list_values(request, NotificationViewSet, Notification.objects.filter(user=request.user, **params))
+
+
+@async_api_view
+async def async_task_list(request):
+    params = validated_params(TaskFilterSerializer, request)
+    if 'project' in params:
+        params['project_id'] = params.pop('project')
+    return await list_values(request, TaskViewSet, visible_tasks(request.user).filter(**params))
+
+
+@async_api_view
+async def async_user_me(request):
+    # aget() runs the prefetches too, so rendering issues no further queries
+    user = await UserSerializer.setup_eager_loading(User.objects.filter(id=request.user.id)).aget()
+    return UserSerializer(user).data
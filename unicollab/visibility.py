@@ -0,0 +1,114 @@
+"""
+Row visibility rules shared by the viewsets.
+
+Each rule is a single WHERE predicate on the base table. Membership is tested
+against the user's membership set, the ids of the projects they belong to,
+inlined as an IN list on the indexed `project_id` column. The set is read from
+the members through table once, on the primary so a lagging replica cannot
+cache a set that is already out of date, kept in the auth cache for
+`UNICOLLAB_MEMBERSHIP_CACHE_TTL` seconds and memoized on the user object for
+the rest of the request. `unicollab.signals` drops it whenever the user's
+memberships change, so the rules never join `members`, never fan out into
+duplicate rows and need no DISTINCT.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+from .authentication import get_auth_cache
+from .models import Project, Task, Resource, Message, ArchivedMessage, Schedule
+
+
+def membership_key(user_id):
+    return f'membership:{user_id}'
+
+
+def forget_memberships(*user_ids):
+    if user_ids:
+        get_auth_cache().delete_many([membership_key(user_id) for user_id in user_ids])
+
+
+def _membership_ttl():
+    return getattr(settings, 'UNICOLLAB_MEMBERSHIP_CACHE_TTL', 300)
+
+
+def _membership_query(user):
+    return Project.members.through.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user.pk).values_list('project_id', flat=True)
+
+
+def member_project_ids(user):
+    """frozenset of the ids of the projects `user` is a member of."""
+    if not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, '_member_project_ids', None)
+    if ids is None:
+        cache = get_auth_cache()
+        ids = cache.get(membership_key(user.pk))
+        if ids is None:
+            ids = frozenset(_membership_query(user))
+            cache.set(membership_key(user.pk), ids, _membership_ttl())
+        user._member_project_ids = ids
+    return ids
+
+
+async def amember_project_ids(user):
+    """Async counterpart of member_project_ids; memoizes on `user` the same way,
+    so the sync rules can be built afterwards inside an async view."""
+    if not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, '_member_project_ids', None)
+    if ids is None:
+        cache = get_auth_cache()
+        ids = await cache.aget(membership_key(user.pk))
+        if ids is None:
+            ids = frozenset([project_id async for project_id in _membership_query(user)])
+            await cache.aset(membership_key(user.pk), ids, _membership_ttl())
+        user._member_project_ids = ids
+    return ids
+
+
+def projects_of(user_ids):
+    """Ids of every project any of `user_ids` belongs to, from the cached
+    membership sets where present and one query for the rest."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return set()
+    cache = get_auth_cache()
+    found = cache.get_many([membership_key(user_id) for user_id in user_ids])
+    project_ids = set().union(*found.values())
+    missing = [user_id for user_id in user_ids if membership_key(user_id) not in found]
+    if missing:
+        project_ids.update(
+            Project.members.through.objects.using(DEFAULT_DB_ALIAS).filter(user_id__in=missing).values_list('project_id', flat=True)
+        )
+    return project_ids
+
+
+def is_member(user, project_id):
+    return project_id in member_project_ids(user)
+
+
+def visible_projects(user):
+    return Project.objects.filter(Q(created_by=user) | Q(pk__in=member_project_ids(user)))
+
+
+def visible_tasks(user):
+    return Task.objects.filter(Q(is_public=True) | Q(assigned_to=user))
+
+
+def visible_resources(user):
+    if not user.is_authenticated:
+        return Resource.objects.filter(is_public=True)
+    return Resource.objects.filter(Q(is_public=True) | Q(uploaded_by=user))
+
+
+def visible_messages(user):
+    return Message.objects.filter(Q(sender=user) | Q(project_id__in=member_project_ids(user)))
+
+
+def visible_archived_messages(user):
+    return ArchivedMessage.objects.filter(Q(sender=user) | Q(project_id__in=member_project_ids(user)))
+
+
+def visible_schedules(user):
+    return Schedule.objects.filter(Q(scheduled_by=user) | Q(project_id__in=member_project_ids(user)))